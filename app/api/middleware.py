@@ -16,10 +16,13 @@ class APIKeyMiddleware(BaseHTTPMiddleware):
     def __init__(self, app, exclude_paths: list = None):
         super().__init__(app)
         self.exclude_paths = exclude_paths or ["/docs", "/redoc", "/openapi.json", "/health"]
+        # 以 / 结尾的排除路径按前缀匹配（如 /api/samples/ 下的所有样本），其余按完整路径匹配
+        self.exclude_prefixes = tuple(path for path in self.exclude_paths if path.endswith("/"))
     
     async def dispatch(self, request: Request, call_next):
         # 检查是否为排除路径
-        if request.url.path in self.exclude_paths:
+        path = request.url.path
+        if path in self.exclude_paths or path.startswith(self.exclude_prefixes):
             return await call_next(request)
         
         # 检查API密钥
@@ -5,18 +5,19 @@ import os
 import hashlib
 from typing import List, Optional
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, status, Depends
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, FileResponse
 
 from app.models.task import (
     TaskCreateRequest, TaskResponse, TaskDetailResponse, 
     AnalysisResultResponse, AnalysisTask, TaskStatus
 )
 from app.core.config import get_settings
-from app.core.security import verify_api_key_header
+from app.core.security import verify_api_key_header, consume_sample_download_token
 from fastapi import Header
 from app.services.task_manager import task_manager
 from app.services.file_handler import FileHandler
 from app.services.vm_pool_manager import get_vm_pool_manager
+from app.utils.helpers import is_safe_filename
 from loguru import logger
 
 router = APIRouter(prefix="/api", tags=["API"])
@@ -382,3 +383,46 @@ async def reset_vm_errors(api_key: str = Depends(verify_api_key)):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"重置VM错误状态失败: {str(e)}"
         )
+
+
+@router.get("/samples/{file_name}")
+async def download_sample(
+    file_name: str,
+    sample_token: str = Header(..., alias="X-Sample-Token")
+):
+    """
+    下载已上传的样本文件
+
+    供虚拟机通过宿主机网络直接拉取样本（见 analysis_settings.sample_share_url），
+    多个虚拟机可并行下载，避免逐个通过guestcontrol上传相同文件。
+    虚拟机中运行的是样本本身，因此不接受API密钥，只接受分析引擎为该文件签发的一次性令牌
+
+    Args:
+        file_name: 样本在上传目录中的文件名（哈希+扩展名）
+        sample_token: 一次性样本下载令牌（通过X-Sample-Token头）
+
+    Returns:
+        FileResponse: 样本文件内容
+    """
+    settings = get_settings()
+
+    if not consume_sample_download_token(sample_token, file_name):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无效或已使用的样本下载令牌"
+        )
+
+    if not is_safe_filename(file_name):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="无效的文件名"
+        )
+
+    file_path = os.path.join(settings.server.upload_dir, file_name)
+    if not os.path.isfile(file_path):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"样本文件不存在: {file_name}"
+        )
+
+    return FileResponse(file_path, media_type="application/octet-stream", filename=file_name)
@@ -66,6 +66,10 @@ class EDRTimeoutSettings(BaseModel):
     availability_check_timeout: int = 15 # EDR软件可用性检查
     service_status_timeout: int = 10     # 服务状态检查
 
+    # 告警增量拉取
+    alert_poll_attempts: int = 3         # 增量拉取告警的最大轮询次数
+    alert_poll_interval: int = 5         # 两次轮询之间的间隔（秒）
+
 
 class AnalysisSettings(BaseModel):
     """分析配置"""
@@ -74,6 +78,10 @@ class AnalysisSettings(BaseModel):
     vm_startup_timeout: int = 60
     file_transfer_timeout: int = 30
 
+    # 样本共享下载地址（客户机可访问的宿主机地址，如 http://192.168.56.1:8000/api/samples）
+    # 配置后虚拟机通过网络并行拉取样本，未配置时使用guestcontrol copyto逐个上传
+    sample_share_url: Optional[str] = None
+
     # EDR特定超时设置
     edr_timeouts: EDRTimeoutSettings = EDRTimeoutSettings()
 
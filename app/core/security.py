@@ -1,12 +1,20 @@
 """
 安全认证模块
 """
+import secrets
+import time
+from typing import Dict, Tuple
+
 from fastapi import HTTPException, Security, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from app.core.config import get_settings
 
 security = HTTPBearer()
 
+# 样本下载令牌: 令牌 -> (绑定的样本文件名, 过期时间)
+# 虚拟机中运行的就是样本本身，不能把长期有效的API密钥交给它，只发放限定单个文件、用后即废的令牌
+_sample_download_tokens: Dict[str, Tuple[str, float]] = {}
+
 
 async def verify_api_key(credentials: HTTPAuthorizationCredentials = Security(security)) -> str:
     """
@@ -45,3 +53,48 @@ def verify_api_key_header(api_key: str) -> bool:
     """
     settings = get_settings()
     return api_key == settings.server.api_key
+
+
+def issue_sample_download_token(file_name: str, ttl: float) -> str:
+    """
+    签发一次性样本下载令牌
+
+    Args:
+        file_name: 令牌允许下载的样本文件名
+        ttl: 有效期（秒）
+
+    Returns:
+        str: 下载令牌
+    """
+    now = time.monotonic()
+    # 顺带清理已过期但未被使用的令牌
+    for token, (_, expires_at) in list(_sample_download_tokens.items()):
+        if expires_at <= now:
+            del _sample_download_tokens[token]
+
+    token = secrets.token_urlsafe(32)
+    _sample_download_tokens[token] = (file_name, now + ttl)
+    return token
+
+
+def consume_sample_download_token(token: str, file_name: str) -> bool:
+    """
+    校验并作废样本下载令牌，无论校验结果如何令牌都只能使用一次
+
+    Args:
+        token: 下载令牌
+        file_name: 请求下载的样本文件名
+
+    Returns:
+        bool: 令牌有效且绑定的正是该文件时返回True
+    """
+    entry = _sample_download_tokens.pop(token, None)
+    if entry is None:
+        return False
+    bound_file_name, expires_at = entry
+    return secrets.compare_digest(bound_file_name, file_name) and expires_at > time.monotonic()
+
+
+def revoke_sample_download_token(token: str) -> None:
+    """作废样本下载令牌（任务结束时调用，令牌未被使用也不再有效）"""
+    _sample_download_tokens.pop(token, None)
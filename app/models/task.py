@@ -33,6 +33,7 @@ class VMTaskStatus(str, Enum):
 class EDRAlert(BaseModel):
     """EDR告警信息"""
 
+    alert_id: Optional[str] = None  # 稳定的告警ID（BLAKE2b摘要）
     severity: str
     alert_type: str
 
@@ -50,9 +51,8 @@ class EDRAlert(BaseModel):
     @model_serializer
     def serialize_model(self):
         """自定义序列化，将detection_time转换为本地时间格式"""
-        from app.utils.helpers import format_timestamp_to_local
-
         return {
+            'alert_id': self.alert_id,
             'severity': self.severity,
             'alert_type': self.alert_type,
             'process_name': self.process_name,
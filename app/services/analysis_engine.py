@@ -5,7 +5,8 @@ from typing import List, Dict, Any
 from loguru import logger
 
 from app.models.task import AnalysisTask, VMTaskResult, VMTaskStatus, EDRAlert
-from app.core.config import get_settings
+from app.core.config import get_settings, EDRTimeoutSettings
+from app.core.security import issue_sample_download_token, revoke_sample_download_token
 from app.services.vm_controller import create_vm_controller
 from app.services.file_handler import FileHandler
 from app.services.windows.edr import EDRManager
@@ -14,6 +15,9 @@ from app.services.vm_pool_manager import get_vm_pool_manager
 
 class AnalysisEngine:
 
+    # 在虚拟机中执行样本命令允许的时间（秒），不含样本下载时间
+    SAMPLE_EXECUTE_TIMEOUT = 30
+
     def __init__(self):
         self.settings = get_settings()
 
@@ -36,6 +40,14 @@ class AnalysisEngine:
 
         self.edr_manager = EDRManager(self.vm_controller, vm_configs)
 
+        # EDR超时及增量拉取配置
+        if (self.settings.windows and
+            self.settings.windows.edr_analysis and
+            self.settings.windows.edr_analysis.analysis_settings):
+            self.edr_timeouts = self.settings.windows.edr_analysis.analysis_settings.edr_timeouts
+        else:
+            self.edr_timeouts = EDRTimeoutSettings()
+
         # 初始化VM资源池管理器（异步初始化将在第一次使用时进行）
         self.vm_pool_manager = None
     
@@ -113,15 +125,24 @@ class AnalysisEngine:
             await self._prepare_vm(vm_name)
 
 
-            vm_result.status = VMTaskStatus.UPLOADING
-            await self._upload_sample_to_vm(task, vm_name)
+            # 分析起始时间在上传样本之前记录：实时防护可能在上传过程中就已产生检测事件
+            analysis_start_time = datetime.utcnow()
 
+            # 配置了样本共享地址时，下载、检查、执行合并为一次guestcontrol调用
+            execution_result = None
+            if self._get_sample_share_url():
+                vm_result.status = VMTaskStatus.ANALYZING
+                execution_result = await self._run_sample_script_in_vm(task, vm_name)
+
+            if execution_result is None:
+                vm_result.status = VMTaskStatus.UPLOADING
+                await self._upload_sample_to_vm(task, vm_name)
 
-            vm_result.status = VMTaskStatus.ANALYZING
-            analysis_start_time = datetime.utcnow()
 
-            # 执行样本文件
-            execution_result = await self._execute_sample_in_vm(task, vm_name)
+                vm_result.status = VMTaskStatus.ANALYZING
+
+                # 执行样本文件
+                execution_result = await self._execute_sample_in_vm(task, vm_name)
 
             # 智能等待分析完成 - 根据执行结果调整等待时间
             if execution_result.get('file_deleted_by_edr', False):
@@ -261,9 +282,8 @@ class AnalysisEngine:
             try:
                 await self.vm_controller.power_off(vm_name)
                 await asyncio.sleep(3)
-            except:
-                logger.error(f"强制关闭虚拟机也失败: {vm_name}")
-                pass
+            except Exception as e:
+                logger.error(f"强制关闭虚拟机也失败: {vm_name} - {str(e)}")
 
     async def _wait_for_vm_ready(self, vm_name: str, timeout: int = 600):
         """
@@ -280,8 +300,8 @@ class AnalysisEngine:
         last_status = "unknown"
         status_change_count = 0
 
-        while (datetime.utcnow() - start_time).total_seconds() < timeout:
-            elapsed = (datetime.utcnow() - start_time).total_seconds()
+        # 每轮只取一次当前时间，循环条件和日志共用同一个已等待时长
+        while (elapsed := (datetime.utcnow() - start_time).total_seconds()) < timeout:
             try:
                 status = await self.vm_controller.get_status(vm_name)
                 power_state = status.get("power_state", "unknown").lower()
@@ -334,25 +354,6 @@ class AnalysisEngine:
         logger.error(f"❌ 虚拟机 {vm_name} 在 {timeout} 秒内未就绪，最终状态: {last_status}，状态变化次数: {status_change_count}")
         raise Exception(f"虚拟机 {vm_name} 在 {timeout} 秒内未就绪")
 
-    async def _get_vm_config(self, vm_name: str):
-        """获取虚拟机配置 - 优先从VM资源池获取"""
-        if self.vm_pool_manager:
-            config = await self.vm_pool_manager.get_vm_config(vm_name)
-            if config:
-                # 转换为类似原始配置对象的结构
-                class VMConfig:
-                    def __init__(self, config_dict):
-                        for key, value in config_dict.items():
-                            setattr(self, key, value)
-                return VMConfig(config)
-
-        # 回退到原始方法
-        if self.settings.windows and self.settings.windows.edr_analysis:
-            for config in self.settings.windows.edr_analysis.vms:
-                if config.name == vm_name:
-                    return config
-        return None
-
     async def _check_vm_system_ready(self, vm_config, max_attempts: int = 5):
         """
         检查虚拟机系统是否就绪
@@ -438,6 +439,125 @@ class AnalysisEngine:
 
         logger.info(f"样本已上传到虚拟机 {vm_name}: {destination_path}")
 
+    def _get_sample_share_url(self):
+        """获取客户机可访问的样本共享下载地址，未配置时返回None"""
+        if self.settings.windows and self.settings.windows.edr_analysis:
+            analysis_settings = self.settings.windows.edr_analysis.analysis_settings
+            if analysis_settings and analysis_settings.sample_share_url:
+                return analysis_settings.sample_share_url.rstrip('/')
+        return None
+
+    def _build_execute_command(self, sample_path: str) -> str:
+        """根据文件类型构建在虚拟机中执行样本的PowerShell命令"""
+        # 只需要最后一段文件名和扩展名，用 rpartition 从右侧取一次，不切分出完整的列表
+        actual_file_name = sample_path.rpartition('\\')[2]
+        file_extension = actual_file_name.rpartition('.')[2].lower() if '.' in actual_file_name else ''
+
+        if file_extension in ['exe', 'com', 'scr', 'bat', 'cmd']:
+            # Windows可执行文件
+            logger.info(f"执行Windows可执行文件: {sample_path}")
+            return f"Start-Process -FilePath '{sample_path}'"
+
+        elif file_extension in ['ps1']:
+            # PowerShell脚本
+            logger.info(f"执行PowerShell脚本: {sample_path}")
+            return f"powershell -ExecutionPolicy Bypass -File '{sample_path}'"
+
+        elif file_extension in ['vbs', 'js']:
+            # 脚本文件
+            logger.info(f"执行脚本文件: {sample_path}")
+            return f"cscript '{sample_path}'"
+
+        elif file_extension in ['elf']:
+            logger.info(f"ELF文件无法在Windows中执行，尝试触发杀软检测: {sample_path}")
+            return f"Get-Content '{sample_path}' -TotalCount 1"
+
+        # 其他文件类型，尝试用默认程序打开
+        logger.info(f"尝试用默认程序执行: {sample_path}")
+        return f"Start-Process -FilePath '{sample_path}'"
+
+    async def _run_sample_script_in_vm(self, task: AnalysisTask, vm_name: str):
+        """
+        通过一次guestcontrol调用完成样本下载、EDR删除检查和执行
+
+        虚拟机从宿主机共享地址下载样本（多个虚拟机可并行拉取），脚本通过标记行回传各步骤结果
+
+        Returns:
+            dict: 执行结果信息，格式同 _execute_sample_in_vm；脚本明确报告下载失败时返回None，由调用方回退到copyto流程
+        """
+        vm_config = None
+        if self.settings.windows and self.settings.windows.edr_analysis:
+            for config in self.settings.windows.edr_analysis.vms:
+                if config.name == vm_name:
+                    vm_config = config
+                    break
+
+        if not vm_config:
+            raise Exception(f"虚拟机配置不存在: {vm_name}")
+
+        desktop_path = getattr(vm_config, 'desktop_path', f"C:\\Users\\{vm_config.username}\\Desktop")
+        file_name_only = os.path.basename(task.file_name)
+        if '.' not in file_name_only:
+            file_name_only += '.bin'
+        sample_path = f"{desktop_path}\\{file_name_only}"
+
+        sample_file_name = os.path.basename(task.file_path)
+        sample_url = f"{self._get_sample_share_url()}/{sample_file_name}"
+        execute_cmd = self._build_execute_command(sample_path)
+        analysis_settings = self.settings.windows.edr_analysis.analysis_settings
+
+        # 虚拟机中运行的是样本本身，命令行可能被样本读取，不能传入API密钥；
+        # 只签发仅限该文件、只能使用一次的下载令牌，本次调用结束后立即作废
+        download_timeout = analysis_settings.file_transfer_timeout
+        download_token = issue_sample_download_token(sample_file_name, download_timeout)
+
+        # 下载单独限时(-TimeoutSec)，超时时输出下载失败标记；整体超时再加上等待检测和执行样本的时间
+        script = "; ".join([
+            f"try {{ Invoke-WebRequest -Uri '{sample_url}' -OutFile '{sample_path}' -UseBasicParsing "
+            f"-TimeoutSec {download_timeout} "
+            f"-Headers @{{'X-Sample-Token'='{download_token}'}} }} "
+            "catch { Write-Output 'VMM_DOWNLOAD_FAILED'; exit 0 }",
+            # 等待EDR初步检测文件
+            "Start-Sleep -Seconds 3",
+            f"if (-not (Test-Path '{sample_path}')) {{ Write-Output 'VMM_FILE_DELETED'; exit 0 }}",
+            f"try {{ {execute_cmd}; Write-Output 'VMM_EXECUTED' }} catch {{ Write-Output 'VMM_EXECUTE_FAILED' }}",
+        ])
+
+        logger.info(f"在虚拟机 {vm_name} 中一次性下载并执行样本: {sample_url} -> {sample_path}")
+        try:
+            success, output = await self.vm_controller.execute_script_in_vm(
+                vm_config.name, script, vm_config.username, vm_config.password,
+                timeout=download_timeout + 3 + self.SAMPLE_EXECUTE_TIMEOUT
+            )
+        finally:
+            revoke_sample_download_token(download_token)
+
+        # 只有脚本明确报告下载失败时样本才确定没有运行，才能回退到copyto流程；
+        # 其他失败（例如前台运行的脚本类样本超时）时样本可能已经执行，不能再上传执行一次
+        if 'VMM_DOWNLOAD_FAILED' in output:
+            logger.warning(f"共享地址下载样本失败，回退到guestcontrol上传: {vm_name} - {output}")
+            return None
+
+        result = {
+            'file_deleted_by_edr': 'VMM_FILE_DELETED' in output,
+            'execution_failed': 'VMM_EXECUTE_FAILED' in output,
+            'execution_success': 'VMM_EXECUTED' in output
+        }
+
+        if result['file_deleted_by_edr']:
+            logger.info(f"文件已被EDR删除: {sample_path}")
+        elif result['execution_success']:
+            logger.info(f"样本执行命令发送成功: {vm_name}")
+        elif not success:
+            # 没有任何标记行时无法确定样本是否已运行，按执行失败处理，不再重复执行
+            logger.warning(f"样本下载执行脚本失败，样本可能已运行，不再回退上传: {vm_name} - {output}")
+            result['execution_failed'] = True
+        else:
+            logger.warning(f"样本执行命令失败: {vm_name} - {output}")
+            result['execution_failed'] = True
+
+        return result
+
     async def _execute_sample_in_vm(self, task: AnalysisTask, vm_name: str) -> dict:
         """
         在虚拟机中执行样本文件
@@ -474,15 +594,12 @@ class AnalysisEngine:
             file_name_only += '.bin'
         sample_path = f"{desktop_path}\\{file_name_only}"
 
-        # 更新文件名用于后续处理
-        actual_file_name = os.path.basename(sample_path)
-
         # 缩短EDR检测等待时间
         logger.info("等待EDR初步检测文件...")
         await asyncio.sleep(3)  # 从5秒减少到3秒
 
         # 检查文件是否被EDR删除
-        check_file_cmd = f"powershell -Command \"Test-Path '{sample_path}'\""
+        check_file_cmd = f"Test-Path '{sample_path}'"
         file_exists, file_check_output = await self.vm_controller.execute_command_in_vm(
             vm_config.name, check_file_cmd, vm_config.username, vm_config.password, timeout=15  # 减少超时时间
         )
@@ -496,37 +613,13 @@ class AnalysisEngine:
         logger.info(f"文件仍然存在: {sample_path}，继续执行样本")
 
         try:
-            # 根据文件类型选择执行方式（使用实际要执行的文件名）
-            file_extension = actual_file_name.lower().split('.')[-1] if '.' in actual_file_name else ''
-
-            if file_extension in ['exe', 'com', 'scr', 'bat', 'cmd']:
-                # Windows可执行文件
-                execute_cmd = f"Start-Process -FilePath '{sample_path}'"
-                logger.info(f"执行Windows可执行文件: {sample_path}")
-
-            elif file_extension in ['ps1']:
-                # PowerShell脚本
-                execute_cmd = f"powershell -ExecutionPolicy Bypass -File '{sample_path}'"
-                logger.info(f"执行PowerShell脚本: {sample_path}")
-
-            elif file_extension in ['vbs', 'js']:
-                # 脚本文件
-                execute_cmd = f"cscript '{sample_path}'"
-                logger.info(f"执行脚本文件: {sample_path}")
-
-            elif file_extension in ['elf']:
-                logger.info(f"ELF文件无法在Windows中执行，尝试触发杀软检测: {sample_path}")
-                execute_cmd = f"Get-Content '{sample_path}' -TotalCount 1"
-
-            else:
-                # 其他文件类型，尝试用默认程序打开
-                execute_cmd = f"Start-Process -FilePath '{sample_path}'"
-                logger.info(f"尝试用默认程序执行: {sample_path}")
+            # 根据文件类型选择执行方式
+            execute_cmd = self._build_execute_command(sample_path)
 
             # 在虚拟机中执行命令，缩短超时时间
             success, output = await self.vm_controller.execute_command_in_vm(
-                vm_config.name, f'powershell -Command "{execute_cmd}"',
-                vm_config.username, vm_config.password, timeout=30  # 从60秒减少到30秒
+                vm_config.name, execute_cmd,
+                vm_config.username, vm_config.password, timeout=self.SAMPLE_EXECUTE_TIMEOUT
             )
 
             if success:
@@ -550,10 +643,28 @@ class AnalysisEngine:
         logger.info(f"collect {vm_name} edr result")
 
         try:
-            # 从EDR系统获取告警
-            alerts = await self.edr_manager.collect_alerts_from_vm(
-                vm_name, start_time, datetime.utcnow(), file_hash, file_name
-            )
+            # 支持游标的客户端增量轮询，每次只获取上次轮询之后的新记录；
+            # 其他客户端每次都会重新读取完整报告，只查询一次
+            alerts = []
+            cursor = None
+            if self.edr_manager.supports_incremental(vm_name):
+                poll_attempts = max(1, self.edr_timeouts.alert_poll_attempts)
+            else:
+                poll_attempts = 1
+
+            for attempt in range(poll_attempts):
+                new_alerts, cursor = await self.edr_manager.collect_alerts_since(
+                    vm_name, cursor, start_time, datetime.utcnow(), file_hash, file_name
+                )
+                alerts.extend(new_alerts)
+
+                # 已命中样本相关告警，无需继续轮询
+                if self._has_sample_hit(new_alerts, file_name):
+                    logger.info(f"第 {attempt + 1} 次轮询命中样本告警，停止收集: {vm_name}")
+                    break
+
+                if attempt < poll_attempts - 1:
+                    await asyncio.sleep(self.edr_timeouts.alert_poll_interval)
 
             # 对报警进行去重处理：相同alert_type和file_path的报警，只保留detection_time最新的
             deduplicated_alerts = self._deduplicate_alerts(alerts)
@@ -566,6 +677,20 @@ class AnalysisEngine:
             logger.error(f"failed to collect edr result: {str(e)}")
             return []
 
+    def _has_sample_hit(self, alerts: List[EDRAlert], file_name: str) -> bool:
+        """
+        判断告警中是否已包含当前样本的检测结果
+
+        告警中不携带文件哈希，因此按文件名匹配告警路径；没有文件名时任意告警即视为命中
+        """
+        if not alerts:
+            return False
+        if not file_name:
+            return True
+
+        sample_name = os.path.basename(file_name).lower()
+        return any(sample_name in (alert.file_path or "").lower() for alert in alerts)
+
     def _deduplicate_alerts(self, alerts: List[EDRAlert]) -> List[EDRAlert]:
         """
         对报警进行去重处理：相同source、alert_type和file_path的报警，只保留detection_time最新的
@@ -585,34 +710,13 @@ class AnalysisEngine:
         for alert in alerts:
             # 创建唯一键：source + alert_type + file_path
             key = (alert.source, alert.alert_type, alert.file_path)
+            existing_alert = alert_map.get(key)
 
-            # 使用detection_time进行时间比较
-            current_detection_time = alert.detection_time or ""
-
-            if key not in alert_map:
-                # 第一次遇到这个组合，直接添加
+            # 空字符串小于任何时间字符串，一次比较即可覆盖：
+            # 首次出现、当前更新、当前有时间而现有没有时间 → 替换；其余保留现有报警
+            if existing_alert is None or (alert.detection_time or "") > (existing_alert.detection_time or ""):
                 alert_map[key] = alert
-                logger.debug(f"添加新报警: {alert.source} - {alert.alert_type} - {alert.file_path} - {current_detection_time}")
-            else:
-                # 已存在相同组合，比较detection_time
-                existing_alert = alert_map[key]
-                existing_detection_time = existing_alert.detection_time or ""
-
-                # 比较时间字符串（如果都有值才比较，否则保留第一个）
-                if current_detection_time and existing_detection_time:
-                    if current_detection_time > existing_detection_time:
-                        # 当前报警更新，替换
-                        alert_map[key] = alert
-                        logger.debug(f"替换报警: {alert.source} - {alert.alert_type} - {alert.file_path} - {existing_detection_time} -> {current_detection_time}")
-                    else:
-                        logger.debug(f"保留原报警: {alert.source} - {alert.alert_type} - {alert.file_path} - {existing_detection_time} (跳过 {current_detection_time})")
-                elif current_detection_time and not existing_detection_time:
-                    # 当前有时间，现有的没有时间，替换
-                    alert_map[key] = alert
-                    logger.debug(f"替换报警(时间更完整): {alert.source} - {alert.alert_type} - {alert.file_path}")
-                else:
-                    # 保留现有的报警
-                    logger.debug(f"保留原报警: {alert.source} - {alert.alert_type} - {alert.file_path}")
+                logger.debug("记录报警: {} - {} - {} - {}", alert.source, alert.alert_type, alert.file_path, alert.detection_time)
 
         # 返回去重后的报警列表
         deduplicated_alerts = list(alert_map.values())
@@ -2,15 +2,50 @@
 文件处理模块
 """
 import os
+import asyncio
+import mmap
 import hashlib
 import shutil
-import aiofiles
+import tempfile
 from typing import Dict, Any
 from fastapi import UploadFile
 from loguru import logger
 
 from app.core.config import get_settings
 
+# 分块计算哈希时每次读取的大小：块越大，每块的线程切换和Python调用开销占比越小，
+# SHA-256本身由OpenSSL实现，CPU支持时自动使用SHA指令扩展
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# 不小于该大小的块放到线程中计算哈希并写盘（hashlib计算时释放GIL），更小的块直接处理，避免线程切换开销
+THREADED_CHUNK_MIN_SIZE = 256 * 1024
+
+# mkstemp创建的临时文件权限固定为0600，保存后恢复为按当前umask直接创建文件时的默认权限；
+# umask只能通过设置来读取，在导入时读取一次，运行中不再临时修改进程的umask
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+DEFAULT_FILE_MODE = 0o666 & ~_UMASK
+
+
+def _hash_and_write(hasher, f, chunk: bytes) -> None:
+    """更新哈希并写入一块数据，大块时整体放在一次线程调用中完成"""
+    hasher.update(chunk)
+    f.write(chunk)
+
+
+def _hash_file_mmap(file_path: str) -> str:
+    """通过mmap将整个文件一次交给哈希计算，由内核按需读入页面"""
+    hash_sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        # 空文件无法mmap，直接返回空内容的哈希
+        if os.fstat(f.fileno()).st_size == 0:
+            return hash_sha256.hexdigest()
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            hash_sha256.update(mm)
+    return hash_sha256.hexdigest()
+
 
 class FileHandler:
     """文件处理器"""
@@ -32,34 +67,48 @@ class FileHandler:
             # 确保上传目录存在
             os.makedirs(self.settings.server.upload_dir, exist_ok=True)
 
-            # 读取文件内容
-            content = await file.read()
-            file_size = len(content)
-
-            # 计算文件哈希
-            file_hash = hashlib.sha256(content).hexdigest()
-
-            # 生成文件路径
-            file_extension = os.path.splitext(file.filename)[1] if file.filename else ""
-            if not file_extension:
-                file_extension = ".bin"
-            file_name = f"{file_hash}{file_extension}"
-            file_path = os.path.join(self.settings.server.upload_dir, file_name)
-
-            # 如果文件已存在，直接返回信息
-            if os.path.exists(file_path):
-                logger.info(f"文件已存在: {file_path}")
-                return {
-                    "path": file_path,
-                    "hash": file_hash,
-                    "size": file_size,
-                    "original_name": file.filename,
-                    "is_compressed": False
-                }
-
-            # 保存文件
-            async with aiofiles.open(file_path, 'wb') as f:
-                await f.write(content)
+            # 分块读取上传内容，边计算哈希边写入上传目录下的临时文件，不把整个文件读入内存
+            hash_sha256 = hashlib.sha256()
+            file_size = 0
+            fd, temp_path = tempfile.mkstemp(dir=self.settings.server.upload_dir, suffix=".part")
+            try:
+                # 直接使用mkstemp返回的文件描述符写入，每块的哈希和写盘合并为一次线程调用，
+                # 不再为每次写入单独切换一次线程
+                with os.fdopen(fd, 'wb') as f:
+                    while chunk := await file.read(HASH_CHUNK_SIZE):
+                        if len(chunk) >= THREADED_CHUNK_MIN_SIZE:
+                            await asyncio.to_thread(_hash_and_write, hash_sha256, f, chunk)
+                        else:
+                            _hash_and_write(hash_sha256, f, chunk)
+                        file_size += len(chunk)
+
+                # 计算文件哈希
+                file_hash = hash_sha256.hexdigest()
+
+                # 生成文件路径
+                file_extension = os.path.splitext(file.filename)[1] if file.filename else ""
+                if not file_extension:
+                    file_extension = ".bin"
+                file_name = f"{file_hash}{file_extension}"
+                file_path = os.path.join(self.settings.server.upload_dir, file_name)
+
+                # 如果文件已存在，直接返回信息
+                if os.path.exists(file_path):
+                    logger.info(f"文件已存在: {file_path}")
+                    return {
+                        "path": file_path,
+                        "hash": file_hash,
+                        "size": file_size,
+                        "original_name": file.filename,
+                        "is_compressed": False
+                    }
+
+                # 内容写完后再按哈希命名，其他请求不会看到写了一半的文件
+                os.replace(temp_path, file_path)
+                os.chmod(file_path, DEFAULT_FILE_MODE)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
 
             logger.info(f"文件已保存: {file_path} (大小: {file_size} bytes)")
 
@@ -88,13 +137,8 @@ class FileHandler:
             str: SHA256哈希值
         """
         try:
-            hash_sha256 = hashlib.sha256()
-            
-            async with aiofiles.open(file_path, 'rb') as f:
-                while chunk := await f.read(8192):
-                    hash_sha256.update(chunk)
-            
-            return hash_sha256.hexdigest()
+            # 整个计算放在一次线程调用中完成，不再每读一块都切换一次线程
+            return await asyncio.to_thread(_hash_file_mmap, file_path)
             
         except Exception as e:
             logger.error(f"计算文件哈希失败: {str(e)}")
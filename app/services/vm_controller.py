@@ -1,4 +1,6 @@
 import os
+import re
+import locale
 import subprocess
 import time
 import asyncio
@@ -8,6 +10,13 @@ from loguru import logger
 
 from app.core.config import get_settings
 
+# Encoding used by subprocess.run(text=True); async subprocesses return bytes,
+# so decode them the same way
+_OUTPUT_ENCODING = locale.getpreferredencoding(False)
+
+# The only showvminfo --machinereadable fields get_status reports
+_VMINFO_FIELD_RE = re.compile(r'^[ \t]*(VMState|GuestAdditionsVersion)[ \t]*=(.*)$', re.MULTILINE)
+
 
 class VMController(ABC):
  
@@ -48,14 +57,67 @@ class VBoxManageController(VMController):
                 return path
 
         raise FileNotFoundError("VBoxManage not found, please ensure VirtualBox is installed")
-    
+
+    @staticmethod
+    def _decode_output(data: bytes) -> str:
+        """Decode process output like text mode does, including newline translation"""
+        return data.decode(_OUTPUT_ENCODING, errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+
+    # Set once the running event loop turns out not to support subprocesses, e.g. the
+    # selector loop uvicorn installs on Windows with reload=True
+    _subprocess_unsupported = False
+
+    async def _run_process(self, cmd: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """
+        Run a VBoxManage command without blocking the event loop
+
+        Mirrors subprocess.run(capture_output=True, text=True), including raising
+        subprocess.TimeoutExpired, so callers keep their existing error handling.
+        Falls back to subprocess.run in a worker thread on loops without subprocess
+        support; that path can't be cancelled and relies on the timeout to end the process
+        """
+        if VBoxManageController._subprocess_unsupported:
+            return await self._run_process_in_thread(cmd, timeout)
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+        except NotImplementedError:
+            logger.warning("Event loop has no subprocess support, running VBoxManage in worker threads")
+            VBoxManageController._subprocess_unsupported = True
+            return await self._run_process_in_thread(cmd, timeout)
+
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout)
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            raise subprocess.TimeoutExpired(cmd, timeout)
+        except asyncio.CancelledError:
+            # Don't leave an orphaned VBoxManage process behind when the caller cancels
+            proc.kill()
+            await proc.wait()
+            raise
+
+        return subprocess.CompletedProcess(
+            cmd, proc.returncode, self._decode_output(stdout), self._decode_output(stderr)
+        )
+
+    async def _run_process_in_thread(self, cmd: List[str], timeout: Optional[float] = None) -> subprocess.CompletedProcess:
+        """Blocking subprocess.run in a worker thread, decoded the same way as _run_process"""
+        result = await asyncio.to_thread(subprocess.run, cmd, capture_output=True, timeout=timeout)
+        return subprocess.CompletedProcess(
+            cmd, result.returncode, self._decode_output(result.stdout), self._decode_output(result.stderr)
+        )
+
     async def _run_vboxmanage(self, *args) -> bool:
         """Execute VBoxManage command"""
         try:
             cmd = [self.vboxmanage_path] + list(args)
             logger.debug(f"Executing command: {' '.join(cmd)}")
 
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=300)
+            result = await self._run_process(cmd, timeout=300)
 
             if result.returncode == 0:
                 logger.debug(f"Command executed successfully: {result.stdout}")
@@ -171,15 +233,14 @@ class VBoxManageController(VMController):
         """Get virtual machine status"""
         try:
             cmd = [self.vboxmanage_path, "showvminfo", vm_name, "--machinereadable"]
-            result = subprocess.run(cmd, capture_output=True, text=True)
+            result = await self._run_process(cmd)
 
             if result.returncode == 0:
-                # Parse output
+                # Pick the needed fields straight out of the output instead of
+                # splitting every line into a dict; get_status is polled in wait loops
                 info = {}
-                for line in result.stdout.split('\n'):
-                    if '=' in line:
-                        key, value = line.split('=', 1)
-                        info[key.strip()] = value.strip('"')
+                for match in _VMINFO_FIELD_RE.finditer(result.stdout):
+                    info[match.group(1)] = match.group(2).strip('"')
 
                 return {
                     "power_state": info.get("VMState", "unknown"),
@@ -224,7 +285,7 @@ class VBoxManageController(VMController):
             ]
 
             logger.info(f"Creating target directory: {' '.join(mkdir_cmd)}")
-            mkdir_result = subprocess.run(mkdir_cmd, capture_output=True, text=True, timeout=60)
+            mkdir_result = await self._run_process(mkdir_cmd, timeout=60)
             if mkdir_result.returncode != 0:
                 logger.warning(f"Failed to create directory (may already exist): {mkdir_result.stderr}")
 
@@ -236,7 +297,7 @@ class VBoxManageController(VMController):
             ]
 
             logger.info(f"Executing file copy command: {' '.join(cmd)}")
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=120)
+            result = await self._run_process(cmd, timeout=120)
 
             if result.returncode == 0:
                 logger.info(f"File copy successful: {remote_path}")
@@ -277,17 +338,18 @@ class VBoxManageController(VMController):
             logger.info(f"File will be transferred in {len(chunks)} chunks")
 
             # Clear target file
-            clear_cmd = f'powershell -Command "if (Test-Path \'{remote_path}\') {{ Remove-Item \'{remote_path}\' -Force }}"'
+            clear_cmd = f"if (Test-Path '{remote_path}') {{ Remove-Item '{remote_path}' -Force }}"
             await self.execute_command_in_vm(vm_name, clear_cmd, username, password, timeout=30)
 
-            # Write file chunk by chunk
+            # Write file chunk by chunk; execute_command_in_vm already runs PowerShell,
+            # so pass the script directly instead of starting a nested powershell per chunk
             for i, chunk in enumerate(chunks):
                 if i == 0:
                     # First chunk: create new file
-                    ps_cmd = f'powershell -Command "[System.Convert]::FromBase64String(\'{chunk}\') | Set-Content -Path \'{remote_path}\' -Encoding Byte"'
+                    ps_cmd = f"[System.Convert]::FromBase64String('{chunk}') | Set-Content -Path '{remote_path}' -Encoding Byte"
                 else:
                     # Subsequent chunks: append to file
-                    ps_cmd = f'powershell -Command "[System.Convert]::FromBase64String(\'{chunk}\') | Add-Content -Path \'{remote_path}\' -Encoding Byte"'
+                    ps_cmd = f"[System.Convert]::FromBase64String('{chunk}') | Add-Content -Path '{remote_path}' -Encoding Byte"
 
                 success, output = await self.execute_command_in_vm(vm_name, ps_cmd, username, password, timeout=60)
                 if not success:
@@ -297,7 +359,7 @@ class VBoxManageController(VMController):
                 logger.info(f"Transferred {i+1}/{len(chunks)} chunks")
 
             # Verify file size
-            verify_cmd = f'powershell -Command "(Get-Item \\"{remote_path}\\").Length"'
+            verify_cmd = f"(Get-Item '{remote_path}').Length"
             success, size_output = await self.execute_command_in_vm(vm_name, verify_cmd, username, password, timeout=30)
 
             if success and size_output.strip().isdigit():
@@ -329,7 +391,7 @@ class VBoxManageController(VMController):
                 "copyfrom", remote_path, local_path
             ]
 
-            result = subprocess.run(cmd, capture_output=True, text=True, timeout=60)
+            result = await self._run_process(cmd, timeout=60)
 
             if result.returncode == 0:
                 logger.info(f"File copy successful: {local_path}")
@@ -358,12 +420,14 @@ class VBoxManageController(VMController):
                 "--",
                 "/c",  # cmd.exe parameter, execute and close
                 "powershell",
+                "-NoProfile",
+                "-NonInteractive",
                 "-Command",
                 command
             ]
 
             logger.debug(f"{vbox_cmd}")
-            result = subprocess.run(vbox_cmd, capture_output=True, text=True, timeout=timeout)
+            result = await self._run_process(vbox_cmd, timeout=timeout)
             logger.info(f"Command execution completed, return code: {result.returncode}")
 
             if result.returncode == 0:
@@ -401,7 +465,7 @@ class VBoxManageController(VMController):
             if arguments:
                 vbox_cmd.extend(["--"] + arguments)
 
-            result = subprocess.run(vbox_cmd, capture_output=True, text=True, timeout=timeout)
+            result = await self._run_process(vbox_cmd, timeout=timeout)
 
             if result.returncode == 0:
                 logger.info("Program execution successful")
@@ -418,7 +482,18 @@ class VBoxManageController(VMController):
             return False, str(e)
 
 
+    async def execute_script_in_vm(self, vm_name: str, script: str, username: str = "vboxuser", password: str = "123456", timeout: int = 120) -> tuple[bool, str]:
+        """Execute a multi-step PowerShell script in a single guestcontrol session"""
+        powershell_path = r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
+        arguments = ["-NoProfile", "-NonInteractive", "-ExecutionPolicy", "Bypass", "-Command", script]
+        return await self.execute_program_in_vm(vm_name, powershell_path, arguments, username, password, timeout)
+
  
+# Shared controller instances keyed by controller type, so every analysis engine
+# and all of its EDR clients reuse the same controller
+_shared_controllers: Dict[str, VMController] = {}
+
+
 def create_vm_controller(controller_type: str = None) -> VMController:
     if controller_type is None:
         # Read controller type from configuration
@@ -426,7 +501,15 @@ def create_vm_controller(controller_type: str = None) -> VMController:
         settings = get_settings()
         controller_type = settings.virtualization.controller_type
 
-    if controller_type.lower() == "virtualbox":
-        return VBoxManageController()
+    controller_key = controller_type.lower()
+    controller = _shared_controllers.get(controller_key)
+    if controller is not None:
+        return controller
+
+    if controller_key == "virtualbox":
+        controller = VBoxManageController()
     else:
         raise ValueError(f"not support vm type: {controller_type}")
+
+    _shared_controllers[controller_key] = controller
+    return controller
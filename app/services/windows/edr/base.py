@@ -7,7 +7,7 @@ It provides a common interface that all EDR implementations must follow.
 
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import List, Optional
+from typing import Any, List, Optional, Tuple
 
 from app.models.task import EDRAlert
 from app.services.vm_controller import VMController
@@ -23,6 +23,11 @@ class EDRClient(ABC):
     this interface to provide consistent functionality across different EDR systems.
     """
 
+    # Whether collect_alerts_since can pull only records after a vendor-side cursor.
+    # Clients without one re-read the whole report on every call, so callers should
+    # query them once instead of polling.
+    supports_incremental: bool = False
+
     def __init__(self, vm_name: str, vm_controller: VMController, username: str = "vboxuser", password: str = "123456"):
         """
         Initialize the EDR client.
@@ -73,3 +78,31 @@ class EDRClient(ABC):
             NotImplementedError: If the subclass doesn't implement this method
         """
         pass
+
+    async def collect_alerts_since(self, cursor: Optional[Any], start_time: datetime,
+                                   end_time: Optional[datetime] = None,
+                                   file_hash: Optional[str] = None,
+                                   file_name: Optional[str] = None) -> Tuple[List[EDRAlert], Any]:
+        """
+        Incrementally retrieve alerts that appeared after the given cursor.
+
+        The default implementation has no vendor-side bookmark: it passes the
+        previous poll time to get_alerts, but vendor clients don't filter on it,
+        so every call re-reads the full report and returns all alerts again.
+        Callers should only poll clients with supports_incremental set; those
+        override this to pull just the new records (e.g. by event RecordId).
+
+        Args:
+            cursor: Opaque cursor returned by the previous call (None on first poll)
+            start_time: Start time of the analysis window
+            end_time: End time for alert search (optional)
+            file_hash: Specific file hash to search for (optional)
+            file_name: Specific file name to search for (optional)
+
+        Returns:
+            Tuple of (new alerts, cursor to pass to the next call)
+        """
+        since = cursor if isinstance(cursor, datetime) else start_time
+        poll_time = datetime.utcnow()
+        alerts = await self.get_alerts(since, end_time, file_hash, file_name)
+        return alerts, poll_time
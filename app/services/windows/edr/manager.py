@@ -6,8 +6,9 @@ for multiple virtual machines. It acts as a factory and coordinator for
 various EDR implementations.
 """
 
+from functools import lru_cache
 from datetime import datetime
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Type
 
 from loguru import logger
 
@@ -20,6 +21,22 @@ from .windows_mcafee import McafeeEDRClient
 from .windows_avira import AviraEDRClient
 from .windows_trend import TrendMicroEDRClient
 
+# 杀软类型 -> EDR客户端类，新增杀软支持时在此注册
+EDR_CLIENT_REGISTRY: Dict[str, Type[EDRClient]] = {
+    'defender': WindowsDefenderEDRClient,
+    'kaspersky': KasperskyEDRClient,
+    'mcafee': McafeeEDRClient,
+    'avira': AviraEDRClient,
+    'trend': TrendMicroEDRClient,
+}
+
+
+@lru_cache(maxsize=16)
+def _normalize_antivirus_type(antivirus_type: str) -> str:
+    """统一杀软类型写法（去空白、小写），保证注册表查找一致"""
+    return antivirus_type.strip().lower()
+
+
 class EDRManager:
     """
     EDR管理器 - 管理不同虚拟机的EDR客户端
@@ -56,27 +73,17 @@ class EDRManager:
         Returns:
             对应的EDR客户端实例
         """
-        antivirus_type = vm_config.get('antivirus', 'defender').lower()
+        antivirus_type = _normalize_antivirus_type(vm_config.get('antivirus', 'defender'))
         vm_name = vm_config['name']
         username = vm_config.get('username', 'vboxuser')
         password = vm_config.get('password', '123456')
 
-        if antivirus_type == 'defender':
-            return WindowsDefenderEDRClient(vm_name, self.vm_controller, username, password)
-        elif antivirus_type == 'kaspersky':
-            return KasperskyEDRClient(vm_name, self.vm_controller, username, password)
-        elif antivirus_type == 'mcafee':
-            return McafeeEDRClient(vm_name, self.vm_controller, username, password)
-        elif antivirus_type == 'avira':
-            return AviraEDRClient(vm_name, self.vm_controller, username, password)
-        elif antivirus_type == 'trend':
-            return TrendMicroEDRClient(vm_name, self.vm_controller, username, password)    
-        # 可以在这里继续添加其他杀软的支持
-        # elif antivirus_type == 'symantec':
-        #     return SymantecEDRClient(vm_name, self.vm_controller, username, password)
-        else:
+        client_cls = EDR_CLIENT_REGISTRY.get(antivirus_type)
+        if client_cls is None:
             logger.warning(f"不支持的杀软类型: {antivirus_type}，使用默认的Windows Defender客户端")
-            return WindowsDefenderEDRClient(vm_name, self.vm_controller, username, password)
+            client_cls = WindowsDefenderEDRClient
+
+        return client_cls(vm_name, self.vm_controller, username, password)
 
     async def collect_alerts_from_vm(self, vm_name: str, start_time: datetime,
                                    end_time: Optional[datetime] = None,
@@ -99,8 +106,54 @@ class EDRManager:
             logger.error(f"虚拟机EDR客户端不存在: {vm_name}")
             return []
 
+        return await self._collect_from_client(self.edr_clients[vm_name], start_time, end_time, file_hash, file_name)
+
+    async def _collect_from_client(self, edr_client: EDRClient, start_time: datetime,
+                                   end_time: Optional[datetime] = None,
+                                   file_hash: Optional[str] = None,
+                                   file_name: Optional[str] = None) -> List[EDRAlert]:
+        """调用单个EDR客户端获取告警，客户端返回None时按空列表处理"""
+        alerts = await edr_client.get_alerts(start_time, end_time, file_hash, file_name)
+        return alerts or []
+
+    def supports_incremental(self, vm_name: str) -> bool:
+        """
+        指定虚拟机的EDR客户端是否支持按游标增量拉取告警
+
+        Args:
+            vm_name: 虚拟机名称
+
+        Returns:
+            bool: 不支持或客户端不存在时返回False，调用方只需查询一次
+        """
+        edr_client = self.edr_clients.get(vm_name)
+        return bool(edr_client and edr_client.supports_incremental)
+
+    async def collect_alerts_since(self, vm_name: str, cursor: Optional[Any],
+                                   start_time: datetime,
+                                   end_time: Optional[datetime] = None,
+                                   file_hash: Optional[str] = None,
+                                   file_name: Optional[str] = None) -> Tuple[List[EDRAlert], Any]:
+        """
+        从指定虚拟机增量收集告警，只拉取游标之后的新记录
+
+        Args:
+            vm_name: 虚拟机名称
+            cursor: 上一次调用返回的游标（首次为None）
+            start_time: 开始时间
+            end_time: 结束时间（可选）
+            file_hash: 文件哈希（可选）
+            file_name: 文件名（可选）
+
+        Returns:
+            (新增EDRAlert列表, 新游标)
+        """
+        if vm_name not in self.edr_clients:
+            logger.error(f"虚拟机EDR客户端不存在: {vm_name}")
+            return [], cursor
+
         edr_client = self.edr_clients[vm_name]
-        return await edr_client.get_alerts(start_time, end_time, file_hash, file_name)
+        return await edr_client.collect_alerts_since(cursor, start_time, end_time, file_hash, file_name)
 
     def add_vm_config(self, vm_config: Dict[str, Any]) -> None:
         """
@@ -121,11 +174,10 @@ class EDRManager:
         Args:
             vm_name: 虚拟机名称
         """
-        if vm_name in self.vm_configs:
-            del self.vm_configs[vm_name]
-        if vm_name in self.edr_clients:
-            del self.edr_clients[vm_name]
-        logger.info(f"移除虚拟机EDR客户端: {vm_name}")
+        removed_config = self.vm_configs.pop(vm_name, None)
+        removed_client = self.edr_clients.pop(vm_name, None)
+        if removed_config is not None or removed_client is not None:
+            logger.info(f"移除虚拟机EDR客户端: {vm_name}")
 
     def get_supported_antivirus_types(self) -> List[str]:
         """
@@ -134,7 +186,7 @@ class EDRManager:
         Returns:
             支持的杀软类型列表
         """
-        return ['defender', 'kaspersky', 'mcafee', 'avira', 'trend']  # 可以根据实际支持的杀软类型扩展
+        return list(EDR_CLIENT_REGISTRY)
 
     def get_vm_names(self) -> List[str]:
         """
@@ -1,21 +1,29 @@
 
-import os
-import re
-import asyncio
-import json
-from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from datetime import datetime
+from typing import List, Optional
 
-import pytz
 from loguru import logger
 
 from app.models.task import EDRAlert
+from app.utils.helpers import generate_alert_id, json_loads
 from .base import EDRClient
 
 
 class AviraEDRClient(EDRClient):
 
+    POWERSHELL_PATH = r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
+    QUARANTINE_DIR = r"C:\ProgramData\Avira\Endpoint Protection SDK\quarantine"
+    REPORT_SCRIPT = r"C:\get_report\get_report_.ps1"
 
+    # 在虚拟机内一次性枚举并解析所有隔离文件，输出一个JSON数组，避免每个文件单独启动PowerShell
+    QUARANTINE_REPORT_ARGS = (
+        "-NoProfile",
+        "-NonInteractive",
+        "-Command",
+        f"$reports = @(Get-ChildItem '{QUARANTINE_DIR}' -File -Filter '*.qua' | ForEach-Object {{ "
+        f"(& '{REPORT_SCRIPT}' -FilePath $_.FullName | Out-String) | ConvertFrom-Json }}); "
+        f"ConvertTo-Json -InputObject $reports -Compress -Depth 5",
+    )
 
     async def get_alerts(
         self,
@@ -24,95 +32,60 @@ class AviraEDRClient(EDRClient):
         file_hash: Optional[str] = None,
         file_name: Optional[str] = None,
     ) -> List[EDRAlert]:
-        try:
-            report_path = r"'C:\ProgramData\Avira\Endpoint Protection SDK\quarantine'"
-            data = []
-            # get_report_path = f"powershell.exe -Command Get-ChildItem {report_path} -File -Filter '*.qua' |  Select-Object -ExpandProperty Name"
-            # success_get_path, output_path = (
-            #     await self.vm_controller.execute_command_in_vm(
-            #         self.vm_name,
-            #         get_report_path,
-            #         self.username,
-            #         self.password,
-            #         timeout=180,
-            #     )
-            # )
-            program_path = r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
-            arguments = [
-                "-Command",
-                f"Get-ChildItem {report_path} -File -Filter '*.qua' |  Select-Object -ExpandProperty Name",
-            ]
+        """
+        获取Avira隔离区告警
 
-            success_get_path, output_path = (
+        file_hash/file_name 在此有意不使用：隔离文件(.qua)名由Avira生成，与样本文件名无关，
+        报告中也不包含样本哈希，按它们在虚拟机端预过滤会漏掉真实检测。
+        分析前快照中隔离区为空，枚举开销只与本次检测数量相关。
+        """
+        try:
+            success, output = (
                 await self.vm_controller.execute_program_in_vm(
                     self.vm_name,
-                    program_path,
-                    arguments,
+                    self.POWERSHELL_PATH,
+                    list(self.QUARANTINE_REPORT_ARGS),
                     self.username,
                     self.password,
-                    timeout=self.timeouts.file_list_timeout,  # 使用配置的文件列表超时
+                    timeout=self.timeouts.file_list_timeout + self.timeouts.file_read_timeout,
                 )
             )
-            if output_path.strip() == "":
+            if not success:
+                logger.warning(f"获取Avira隔离区报告失败: {output}")
+                return []
+
+            logger.debug("Avira隔离区报告输出:\n{}", output)
+            reports = json_loads(output) if output.strip() else []
+            if not reports:
                 logger.info("Avira隔离区没有文件")
                 return []
-            for line_filename in output_path.splitlines():
-                print(line_filename)  # 文件名
-                if line_filename.endswith(".qua"):
-                    report_path_temp = f"'C:\\ProgramData\\Avira\\Endpoint Protection SDK\\quarantine\\{line_filename}'"
-                    print(f"匹配到文件: {report_path_temp}")
-                    # parse_report = f"powershell.exe -Command C:\\get_report\\get_report_.ps1 -FilePath  {report_path_temp}"
-                    # success, output = await self.vm_controller.execute_command_in_vm(
-                    #     self.vm_name,
-                    #     parse_report,
-                    #     self.username,
-                    #     self.password,
-                    #     timeout=180,
-                    # )
-                    parse_report = [
-                        "-Command",
-                        f"C:\\get_report\\get_report_.ps1 -FilePath  {report_path_temp}",
-                    ]
 
-                    success, output = (
-                        await self.vm_controller.execute_program_in_vm(
-                            self.vm_name,
-                            program_path,
-                            parse_report,
-                            self.username,
-                            self.password,
-                            timeout=self.timeouts.file_read_timeout,  # 使用配置的文件读取超时
-                        )
-                    )
-                    if success and output.strip():
-                        try:
-                            print(f"Output: \n{output}")
-                            # 解析output
-                            parse_report_out = json.loads(output)
-                            alert_hash = str(abs(hash(str(output))))
-                            # dt = datetime.strptime(
-                            #     parse_report_out["utc"], "%Y-%m-%d %H:%M:%S"
-                            # )
-                            if parse_report_out["path"].startswith("\\\\?\\"):
-                                path_f = parse_report_out["path"][4:]
-                            dt = datetime.fromtimestamp(
-                                parse_report_out["utc"]
-                            ).strftime("%Y-%m-%d %H:%M:%S")
-                            alert = EDRAlert(
-                                severity="Critical",
-                                alert_type=parse_report_out["malware"],
-                                detection_time=dt,
-                                detect_reason="Log",
-                                file_path=path_f,
-                                source="Avira"
-                            )
-                            data.append(alert)
-                            return data
-                        except Exception as e:
-                            logger.error(f"解析Avira报告信息失败: {str(e)}")
-                            return []
-                else:
-                    logger.warning(f"匹配文件失败: {line_filename}")
+            return [alert for alert in map(self._build_alert, reports) if alert is not None]
         except Exception as e:
             logger.error(f"获取Avira报告文件列表失败: {str(e)}")
             return []
+
+    def _build_alert(self, parse_report_out: dict) -> Optional[EDRAlert]:
+        """将单个隔离区报告转换为EDRAlert，解析失败时返回None，不影响其余隔离文件"""
+        try:
+            path_f = parse_report_out["path"]
+            if path_f.startswith("\\\\?\\"):
+                path_f = path_f[4:]
+            dt = datetime.fromtimestamp(
+                parse_report_out["utc"]
+            ).strftime("%Y-%m-%d %H:%M:%S")
+            alert_id = generate_alert_id(
+                f"{parse_report_out['path']}|{parse_report_out['utc']}|{parse_report_out['malware']}"
+            )
+            return EDRAlert(
+                alert_id=alert_id,
+                severity="Critical",
+                alert_type=parse_report_out["malware"],
+                detection_time=dt,
+                detect_reason="Log",
+                file_path=path_f,
+                source="Avira"
+            )
+        except Exception as e:
+            logger.error(f"解析Avira报告信息失败: {str(e)}")
+            return None
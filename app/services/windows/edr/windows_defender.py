@@ -2,19 +2,118 @@
 
 import os
 import re
-import asyncio
 from datetime import datetime, timedelta
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 
-import pytz
 from loguru import logger
 
 from app.models.task import EDRAlert
+from app.utils.helpers import generate_alert_id, json_loads
 from .base import EDRClient
 
+# google-re2为可选依赖（线性时间匹配，不回溯，虚拟机返回的事件消息不可信），未安装时回退到标准库re
+# 模式的匹配标志统一写成内联形式 (?im)，两种引擎都能识别
+try:
+    import re2 as _regex
+    RE2_AVAILABLE = True
+except ImportError:
+    _regex = re
+    RE2_AVAILABLE = False
+
+# 从Defender事件消息中提取威胁字段的正则，模块加载时编译一次
+# 字段都位于消息的行首（前面可能有缩进），用 ^[ \t]* 锚定行首，
+# 避免在每个位置上尝试 \s* 回溯，也不会误匹配 "Process Name:" 中的 "Name:"
+# 所有字段标签合并为一个模式，整条消息只扫描一遍
+_THREAT_FIELD_RE = _regex.compile(
+    r'(?im)^[ \t]*(?P<label>名称|Name|ThreatName|路径|Path|进程名称|Process Name|ProcessName|操作|Action|严重性|Severity)'
+    r':\s*(?P<value>[^\r\n]+)'
+)
+
+# 字段标签(小写) -> (字段名, 优先级)，同一字段出现多个标签时取优先级最小的
+# 中文格式: "        名称: TrojanDropper:Win32/Conficker.gen!A"
+# 英文格式: "        Name: TrojanDropper:Win32/Conficker.gen!A"
+# 路径格式: "        路径: file:_C:\Users\vboxuser\Desktop\C9E0917FE3231A652C014AD76B55B26A.exe"
+_THREAT_FIELD_LABELS = {
+    '名称': ('threat_name', 0),
+    'name': ('threat_name', 1),
+    'threatname': ('threat_name', 2),
+    '路径': ('file_path', 0),
+    'path': ('file_path', 1),
+    '进程名称': ('process_name', 0),
+    'process name': ('process_name', 1),
+    'processname': ('process_name', 2),
+    '操作': ('action', 0),
+    'action': ('action', 1),
+    '严重性': ('severity', 0),
+    'severity': ('severity', 1),
+}
+
+# 事件日志输出中的威胁相关关键字，合并为一个不区分大小写的模式，
+# 一次扫描即可判断，无需先复制一份小写的输出再逐个关键字查找
+_THREAT_KEYWORDS_RE = _regex.compile(r'(?i)名称:|name:|threat|trojan|virus|malware|worm|defender')
+
+# 按威胁名称判定严重级别的关键字，不区分大小写；Critical关键字优先于Medium，
+# 所以分成两个模式依次查找，而不是合并成一个按出现位置取第一个匹配的模式
+_CRITICAL_THREAT_RE = _regex.compile(r'(?i)trojan|virus|malware|worm')
+_MEDIUM_THREAT_RE = _regex.compile(r'(?i)adware|pup')
+
+# 事件XML中 <EventData><Data Name="..."> 的字段名 -> 威胁信息字段名，与事件语言无关
+_EVENT_DATA_FIELDS = {
+    'Threat Name': 'threat_name',
+    'Path': 'file_path',
+    'Process Name': 'process_name',
+    'Action Name': 'action',
+    'Severity Name': 'severity',
+}
+
+# 没有路径标签时，在消息任意位置查找 file:_ 路径
+_FILE_PATH_FALLBACK_RE = _regex.compile(r'(?i)file:_([^\r\n;,\s]+)')
+
+# 事件时间最常见的格式为 2025/9/27 15:02:25 或 2025-09-27 15:02[:25]，直接按数字分组构造datetime，
+# 不经过strptime逐个格式尝试；日期分隔符用反向引用保证前后一致（re2不支持反向引用，这里使用标准库re）
+_DETECTION_TIME_RE = re.compile(r'(\d{4})([/-])(\d{1,2})\2(\d{1,2})\s+(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?')
+
+# 快速路径不匹配时回退的strptime格式
+_DETECTION_TIME_FORMATS = (
+    '%Y/%m/%d %H:%M:%S',    # 2025/9/27 15:02:25
+    '%Y-%m-%d %H:%M:%S',    # 2025-09-27 15:02:25
+    '%m/%d/%Y %H:%M:%S',    # 9/27/2025 15:02:25
+    '%Y年%m月%d日 %H:%M:%S',  # 2025年9月27日 15:02:25
+    '%Y/%m/%d %H:%M',       # 2025/9/27 15:02
+    '%Y-%m-%d %H:%M',       # 2025-09-27 15:02
+)
+
+
+def _parse_detection_time(time_part: str) -> Optional[datetime]:
+    """解析事件时间字符串，无法识别时返回None"""
+    match = _DETECTION_TIME_RE.fullmatch(time_part)
+    if match:
+        year, _, month, day, hour, minute, second = match.groups()
+        try:
+            return datetime(int(year), int(month), int(day),
+                            int(hour), int(minute), int(second) if second else 0)
+        except ValueError:
+            return None
+
+    for fmt in _DETECTION_TIME_FORMATS:
+        try:
+            return datetime.strptime(time_part, fmt)
+        except ValueError:
+            continue
+    return None
+
 
 class WindowsDefenderEDRClient(EDRClient):
 
+    # 事件日志可按RecordId在虚拟机端过滤，支持增量轮询
+    supports_incremental = True
+
+    # 首次查询按时间过滤时预留的余量，容忍宿主机与虚拟机之间的时钟偏差
+    EVENT_TIME_SKEW_MARGIN = timedelta(minutes=5)
+
+    # 每次查询返回的最大事件数，以及单次增量轮询最多拉取的页数（剩余事件留给下一次轮询）
+    EVENT_PAGE_SIZE = 20
+    EVENT_MAX_PAGES = 10
 
 
     async def get_alerts(self, start_time: datetime, end_time: Optional[datetime] = None,
@@ -28,10 +127,7 @@ class WindowsDefenderEDRClient(EDRClient):
             # 获取威胁检测信息（通过事件日志）
             threat_data = await self._get_threat_events(file_name)
 
-            #print("=== 威胁数据汇总 ===")
-            #print(f"获取到 {len(threat_data)} 条威胁数据")
-            #for i, data in enumerate(threat_data):
-            #    print(f"记录 {i+1}: {data}")
+            logger.debug("Windows Defender威胁数据 {} 条: {}", len(threat_data), threat_data)
 
             # 转换为EDR告警
             if threat_data:
@@ -44,17 +140,112 @@ class WindowsDefenderEDRClient(EDRClient):
             logger.error(f"获取Windows Defender告警失败: {str(e)}")
             return []
 
-    async def _get_threat_events(self, file_name: Optional[str] = None) -> List[Dict[str, Any]]:
-       
+    async def collect_alerts_since(self, cursor: Optional[Any], start_time: datetime,
+                                   end_time: Optional[datetime] = None,
+                                   file_hash: Optional[str] = None,
+                                   file_name: Optional[str] = None) -> Tuple[List[EDRAlert], Any]:
+        """
+        增量获取告警：首次按StartTime（减去时钟偏差余量）过滤，之后只按RecordId游标拉取新事件
+        """
+        after_record_id = cursor if isinstance(cursor, int) else None
+
+        try:
+            # 按RecordId从旧到新逐页拉取，游标只推进到已读取的最后一条事件，
+            # 单页被 -MaxEvents 截断时继续读取下一页，不会跳过未读取的事件
+            threat_data = []
+            new_cursor = after_record_id
+            for _ in range(self.EVENT_MAX_PAGES):
+                page_data, event_count, last_record_id = await self._query_threat_events(
+                    file_name, start_time, new_cursor
+                )
+                threat_data.extend(page_data)
+                if last_record_id is None:
+                    break
+                new_cursor = last_record_id
+                if event_count < self.EVENT_PAGE_SIZE:
+                    break
+
+            alerts = []
+            if threat_data:
+                alerts.extend(self._convert_threat_data_to_alerts(threat_data, start_time, end_time, file_name))
+
+            logger.info(f"从Windows Defender增量获取到 {len(alerts)} 个告警 (游标: {after_record_id} -> {new_cursor})")
+            return alerts, new_cursor
+
+        except Exception as e:
+            logger.error(f"增量获取Windows Defender告警失败: {str(e)}")
+            return [], cursor
+
+    def _build_event_query(self, start_time: Optional[datetime] = None,
+                           after_record_id: Optional[int] = None) -> str:
+        """
+        构建Defender事件日志查询，尽量在虚拟机端完成时间和RecordId过滤
+
+        所有过滤条件都放进 -FilterXPath，由事件日志服务直接筛选，
+        不再在 -MaxEvents 之后通过 Where-Object 管道逐条过滤。
+        已有RecordId游标时只按游标过滤，不再叠加时间条件；
+        带过滤条件的增量查询按从旧到新的顺序返回，便于按页推进游标
+        """
+        conditions = ["(EventID=1116 or EventID=1117 or EventID=1118 or EventID=1119)"]
+        if after_record_id is not None:
+            conditions.append(f"EventRecordID>{after_record_id}")
+        elif start_time is not None:
+            # start_time为宿主机UTC时间，事件的SystemTime由虚拟机时钟产生，放宽一个时钟偏差余量
+            since = start_time - self.EVENT_TIME_SKEW_MARGIN
+            conditions.append(f"TimeCreated[@SystemTime>=''{since.strftime('%Y-%m-%dT%H:%M:%S')}.000Z'']")
+
+        # 不带过滤条件时仍取最新的事件，否则从最早的匹配事件开始
+        oldest = " -Oldest" if len(conditions) > 1 else ""
+
+        # XPath放在PowerShell单引号字符串中，内部的单引号需要写成两个
+        xpath = f"*[System[{' and '.join(conditions)}]]"
+        query = (
+            "Get-WinEvent -LogName 'Microsoft-Windows-Windows Defender/Operational' "
+            f"-FilterXPath '{xpath}' -MaxEvents {self.EVENT_PAGE_SIZE}{oldest} -ErrorAction SilentlyContinue"
+        )
+
+        # 直接输出JSON数组（@()保证单条事件时也是数组），不再解析Format-List文本；
+        # TimeCreated按固定格式输出本地时间，与原先的显示格式一致，不受虚拟机区域设置影响；
+        # EventData为事件XML中按Name索引的结构化字段，不依赖本地化的消息文本
+        return (
+            "ConvertTo-Json -Compress -Depth 3 -InputObject @(" + query + " | Select-Object "
+            "@{n='TimeCreated';e={$_.TimeCreated.ToString('yyyy/M/d H:mm:ss', [Globalization.CultureInfo]::InvariantCulture)}}, "
+            "RecordId, "
+            "@{n='EventData';e={$d = @{}; foreach ($n in ([xml]$_.ToXml()).Event.EventData.Data) { $d[$n.Name] = $n.'#text' }; $d}}, "
+            "Message)"
+        )
+
+    async def _get_threat_events(self, file_name: Optional[str] = None,
+                                 start_time: Optional[datetime] = None,
+                                 after_record_id: Optional[int] = None) -> List[Dict[str, Any]]:
+        threat_data, _, _ = await self._query_threat_events(file_name, start_time, after_record_id)
+        return threat_data
+
+    async def _query_threat_events(self, file_name: Optional[str] = None,
+                                   start_time: Optional[datetime] = None,
+                                   after_record_id: Optional[int] = None
+                                   ) -> Tuple[List[Dict[str, Any]], int, Optional[int]]:
+        """
+        查询一页Defender事件
+
+        Returns:
+            (威胁记录, 本页事件总数, 本页最大的RecordId)；事件总数和RecordId包含未转为威胁记录的事件，
+            用于判断是否还有下一页以及推进游标
+        """
         try:
             logger.info("查询Windows Defender事件日志...")
             threat_data = []
+            event_count = 0
+            last_record_id = None
+            event_query = self._build_event_query(start_time, after_record_id)
 
   
             program_path = r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
             arguments = [
+                "-NoProfile",
+                "-NonInteractive",
                 "-Command",
-                "Get-WinEvent -FilterHashtable @{LogName='Microsoft-Windows-Windows Defender/Operational'; ID=1116,1117,1118,1119} -MaxEvents 20 | Select-Object TimeCreated, Id, LevelDisplayName, Message | Format-List"
+                event_query
             ]
 
             success, output = await self.vm_controller.execute_program_in_vm(
@@ -62,23 +253,33 @@ class WindowsDefenderEDRClient(EDRClient):
                 timeout=self.timeouts.simple_command_timeout  # 使用配置的超时时间
             )
 
-            # 如果方法1失败，回退到cmd.exe方法
+            # 如果方法1失败，再回退到cmd.exe方法；两者是同一个较重的查询，不并行发起，
+            # 以免在正常路径上让虚拟机重复执行一遍（取消宿主机进程也无法结束虚拟机内的PowerShell）
             if not success:
                 logger.warning("PowerShell直接执行失败，回退到cmd.exe方法...")
-                event_cmd = 'powershell -Command "Get-WinEvent -FilterHashtable @{LogName=\'Microsoft-Windows-Windows Defender/Operational\'; ID=1116,1117,1118,1119} -MaxEvents 20 | Select-Object TimeCreated, Id, LevelDisplayName, Message | Format-List"'
-
+                # execute_command_in_vm 已经通过PowerShell执行，无需再嵌套启动powershell进程
                 success, output = await self.vm_controller.execute_command_in_vm(
-                    self.vm_name, event_cmd, self.username, self.password,
+                    self.vm_name, event_query, self.username, self.password,
                     timeout=self.timeouts.simple_command_timeout  # 使用配置的超时时间
                 )
 
-            #print(f"=== Windows Defender 事件日志查询结果 ===")
-            #print(f"Success: {success}")
-            #print(f"Output: \n{output}")
-            #print("=" * 60)
+            logger.debug("Windows Defender事件日志查询结果: success={}\n{}", success, output)
+
+            if success and ("TimeCreated" in output or "Message" in output):
+                events = self._load_event_log_output(output)
+                event_count = len(events)
+                last_record_id = max(
+                    (event['RecordId'] for event in events if isinstance(event.get('RecordId'), int)),
+                    default=None
+                )
+
+                # 检查是否包含威胁信息
+                if _THREAT_KEYWORDS_RE.search(output):
+                    parsed_events = self._parse_event_log_output(events, file_name)
+                else:
+                    logger.info("事件日志中未发现威胁相关信息")
+                    parsed_events = []
 
-            if success and output.strip() and ("TimeCreated" in output or "Message" in output):
-                parsed_events = self._parse_event_log_output(output, file_name)
                 if parsed_events:
                     logger.info(f"从事件日志解析到 {len(parsed_events)} 个威胁记录")
                     threat_data.extend(parsed_events)
@@ -87,30 +288,32 @@ class WindowsDefenderEDRClient(EDRClient):
             else:
                 logger.warning("事件日志查询失败或无数据")
 
-            return threat_data
+            return threat_data, event_count, last_record_id
 
         except Exception as e:
             logger.error(f"获取威胁事件日志失败: {str(e)}")
-            return []
+            return [], 0, None
 
     def _convert_threat_data_to_alerts(self, threat_data: List[Dict[str, Any]],
                                      start_time: datetime, end_time: Optional[datetime] = None,
-                                     file_name: Optional[str] = None) -> List[EDRAlert]:
+                                     file_name: Optional[str] = None) -> Iterator[EDRAlert]:
         """
-        将威胁数据转换为EDR告警
+        将威胁数据转换为EDR告警，逐条产出，由调用方直接 extend 到结果列表
         """
-        alerts = []
-        #print(f"开始转换 {len(threat_data)} 条威胁数据为EDR告警...")
-        #print(f"时间范围: start_time={start_time}, end_time={end_time}")
+        # 每次调用只取一次当前时间，时间范围边界也在循环外计算
+        now = datetime.now()
+        end_time_check = end_time or now
+        past_24h = now - timedelta(hours=24)
+        past_1h = start_time - timedelta(hours=1)
+
+        # 同一批事件中多条记录常常是同一秒产生的，相同时间字符串只解析一次
+        parsed_times: Dict[str, datetime] = {}
 
-        for i, item in enumerate(threat_data):
+        for item in threat_data:
             try:
-                #print(f"处理第 {i+1} 条记录...")
                 # 检查是否有威胁名称
                 threat_name = item.get('ThreatName') or item.get('threat_name')
-                #print(f"威胁名称: {threat_name}")
                 if not threat_name or threat_name == 'Unknown':
-                    #print("跳过没有威胁名称的记录")
                     continue
 
                 # 获取检测时间
@@ -120,62 +323,28 @@ class WindowsDefenderEDRClient(EDRClient):
                 
                 if detection_time_str:
                     try:
-                        #print(f"原始检测时间字符串: '{detection_time_str}'")
                         # 尝试解析不同的时间格式
                         if isinstance(detection_time_str, str):
-                            # 移除时区信息进行解析
-                            time_part = detection_time_str.split(' (')[0].split('.')[0].strip()
-                            #print(f"处理后的时间字符串: '{time_part}'")
-
-                            # 尝试多种时间格式，包括中文格式
-                            time_formats = [
-                                '%Y/%m/%d %H:%M:%S',    # 2025/9/27 15:02:25
-                                '%Y-%m-%d %H:%M:%S',    # 2025-09-27 15:02:25
-                                '%m/%d/%Y %H:%M:%S',    # 9/27/2025 15:02:25
-                                '%Y年%m月%d日 %H:%M:%S',  # 2025年9月27日 15:02:25
-                                '%Y/%m/%d %H:%M',       # 2025/9/27 15:02
-                                '%Y-%m-%d %H:%M',       # 2025-09-27 15:02
-                            ]
-
-                            detection_time = None
-                            for fmt in time_formats:
-                                try:
-                                    detection_time = datetime.strptime(time_part, fmt)
-                                    #print(f"成功解析时间，使用格式: {fmt} -> {detection_time}")
-                                    break
-                                except ValueError as e:
-                                    #print(f"格式 {fmt} 解析失败: {e}")
-                                    continue
-
+                            detection_time = parsed_times.get(detection_time_str)
                             if detection_time is None:
+                                # 移除时区信息进行解析
+                                time_part = detection_time_str.split(' (')[0].split('.')[0].strip()
+
                                 # 如果所有格式都失败，使用当前时间
-                                #print("所有时间格式解析都失败，使用当前时间")
-                                detection_time = datetime.now()
+                                detection_time = _parse_detection_time(time_part) or now
+                                parsed_times[detection_time_str] = detection_time
                         else:
                             detection_time = detection_time_str
-                    except (ValueError, AttributeError) as e:
-                        #print(f"时间解析异常: {e}")
-                        detection_time = datetime.now()
+                    except (ValueError, AttributeError):
+                        detection_time = now
                 else:
-                    #print("没有检测时间字符串，使用当前时间")
-                    detection_time = datetime.now()
-
-             
-                end_time_check = end_time or datetime.now()
-                #print(f"时间范围检查: start_time={start_time}, detection_time={detection_time}, end_time={end_time_check}")
+                    detection_time = now
 
-             
                 time_range_ok = False
                 if file_name and item.get('FilePath'):
-                  
-                    past_24h = datetime.now() - timedelta(hours=24)
                     time_range_ok = detection_time >= past_24h
-                    #print(f"文件名匹配模式，时间范围: {past_24h} <= {detection_time} = {time_range_ok}")
                 else:
-            
-                    past_1h = start_time - timedelta(hours=1)
                     time_range_ok = past_1h <= detection_time <= end_time_check
-                    # print(f"标准时间范围检查: {past_1h} <= {detection_time} <= {end_time_check} = {time_range_ok}")
 
                 if time_range_ok:
                     # 获取文件路径
@@ -189,20 +358,16 @@ class WindowsDefenderEDRClient(EDRClient):
                                   item.get('process_name') or
                                   'Unknown')
 
-           
                     severity = "High"
-                    if any(keyword in threat_name.lower() for keyword in ['trojan', 'virus', 'malware', 'worm']):
+                    if _CRITICAL_THREAT_RE.search(threat_name):
                         severity = "Critical"
-                    elif any(keyword in threat_name.lower() for keyword in ['adware', 'pup']):
+                    elif _MEDIUM_THREAT_RE.search(threat_name):
                         severity = "Medium"
 
-                    # 获取操作，如果是Unknown就不包含
-                    action = item.get('Action')
-                    if action == 'Unknown':
-                        action = None
-
                     # 创建告警，直接将所有信息放在主字段中
+                    # 稳定的告警ID：由威胁名称、检测时间和文件路径摘要得到，跨进程一致，可用于去重
                     alert = EDRAlert(
+                        alert_id=generate_alert_id(f"{threat_name}|{item.get('DetectionTime')}|{file_path}"),
                         severity=severity,
                         alert_type=threat_name,
                         process_name=process_name if process_name != 'Unknown' else None,
@@ -213,152 +378,73 @@ class WindowsDefenderEDRClient(EDRClient):
                         source='Windows Defender'
                     )
 
-                    alerts.append(alert)
+                    yield alert
 
             except Exception as e:
                 logger.error(f"转换威胁数据失败: {str(e)}")
                 continue
-                
-        return alerts
 
-    def _parse_event_log_output(self, output: str, filename: str = None) -> List[Dict[str, Any]]:
+    def _load_event_log_output(self, output: str) -> List[Dict[str, Any]]:
         """
-        解析Windows事件日志输出 - 专门处理Windows Defender事件日志
+        将事件日志查询输出的JSON解析为事件列表
+        """
+        try:
+            # 调用方已确认输出包含事件字段，这里只做不复制字符串的空白检查
+            if not output or output.isspace():
+                logger.info("事件日志输出为空")
+                return []
+
+            events = json_loads(output)
+            if isinstance(events, dict):
+                events = [events]
+            return [event for event in events if isinstance(event, dict)]
+
+        except Exception as e:
+            logger.error(f"解析事件日志JSON失败: {str(e)}")
+            logger.error(f"原始输出: {output[:500]}...")
+            return []
+
+    def _parse_event_log_output(self, events: List[Dict[str, Any]], filename: str = None) -> List[Dict[str, Any]]:
+        """
+        从事件日志记录中提取威胁信息 - 专门处理Windows Defender事件日志
         """
         #logger.info("解析Windows事件日志输出数据")
         records = []
 
         try:
-            if not output or output.strip() == "":
-                logger.info("事件日志输出为空")
-                return records
-
-            # 检查是否包含威胁信息
-            threat_keywords = ['名称:', 'name:', 'threat', 'trojan', 'virus', 'malware', 'worm', 'defender']
-            if not any(keyword in output.lower() for keyword in threat_keywords):
-                logger.info("事件日志中未发现威胁相关信息")
-                return records
-
-            # 解析Format-List格式的事件日志输出
-            current_record = {}
-            current_message_lines = []
-            in_message = False
-            lines = output.strip().split('\n')
-
-            for line in lines:
-                line_stripped = line.strip()
-
-                if not line_stripped:
-                    # 空行表示一个记录结束
-                    if current_record and current_record.get('TimeCreated'):
-                        # 处理完整的消息
-                        full_message = '\n'.join(current_message_lines)
-                        current_record['Message'] = full_message
-
-                        # 从消息中提取威胁信息
-                        threat_info = self._extract_threat_info_from_message(full_message)
-
-                        # 如果找到威胁名称，或者指定了文件名且路径匹配
-                        should_include = False
-                        if threat_info['threat_name'] != 'Unknown':
-                            should_include = True
-                        elif filename and threat_info['file_path'] != 'Unknown':
-                            # 检查文件路径是否包含指定的文件名
-                            if filename.lower() in threat_info['file_path'].lower():
-                                should_include = True
-
-                        if should_include:
-                            # 构建原始威胁数据的JSON格式
-                            raw_threat_data = {
-                                '名称': threat_info['threat_name'],
-                                '严重性': threat_info['severity'],
-                                '路径': threat_info['file_path'],
-                                '进程名称': threat_info['process_name'],
-                                '操作': threat_info['action'],
-                                '检测时间': current_record.get('TimeCreated'),
-                                '事件ID': current_record.get('Id'),
-                                '完整消息': full_message
-                            }
-
-                            record = {
-                                'ThreatName': threat_info['threat_name'],
-                                'DetectionTime': current_record.get('TimeCreated', datetime.now().isoformat()),
-                                'FilePath': threat_info['file_path'],
-                                'ProcessName': threat_info['process_name'],
-                                'Action': threat_info['action'],
-                                'Severity': threat_info['severity'],
-                                'EventId': current_record.get('Id', 'Unknown'),
-                                'RawData': raw_threat_data,  # 添加原始数据
-                                'source': 'Windows Event Log'
-                            }
-                            records.append(record)
-                            logger.info(f"解析到威胁: {threat_info['threat_name']} -> {threat_info['file_path']}")
-
-                    # 重置当前记录
-                    current_record = {}
-                    current_message_lines = []
-                    in_message = False
+            # 文件名在整个解析过程中不变，预先编译一个不区分大小写的匹配器（Windows路径不区分大小写）
+            filename_re = re.compile(re.escape(os.path.basename(filename)), re.IGNORECASE) if filename else None
+
+            # 逐条处理事件记录
+            for event in events:
+                time_created = event.get('TimeCreated')
+                if not time_created:
                     continue
 
-                # 解析键值对格式 - 检查是否是顶级字段
-                if ':' in line and not line.startswith(' ') and not line.startswith('\t'):
-                    # 这是一个新的顶级字段
-                    parts = line.split(':', 1)
-                    if len(parts) == 2:
-                        key = parts[0].strip()
-                        value = parts[1].strip()
-
-                        if key in ['TimeCreated', 'Id', 'LevelDisplayName']:
-                            current_record[key] = value
-                            in_message = False
-                        elif key == 'Message':
-                            current_record[key] = value
-                            current_message_lines = [value] if value else []
-                            in_message = True
+                # 优先使用结构化的EventData字段，缺少威胁名称时再从消息文本中提取
+                event_data = event.get('EventData')
+                if isinstance(event_data, dict) and event_data.get('Threat Name'):
+                    threat_info = self._extract_threat_info_from_event_data(event_data)
                 else:
-                    # 这是消息的续行或者缩进内容
-                    if in_message:
-                        current_message_lines.append(line)  # 保留原始格式，包括缩进
-
-            # 处理最后一个记录
-            if current_record and current_record.get('TimeCreated'):
-                full_message = '\n'.join(current_message_lines)
-                current_record['Message'] = full_message
-
-                threat_info = self._extract_threat_info_from_message(full_message)
+                    threat_info = self._extract_threat_info_from_message(event.get('Message') or '')
 
                 # 如果找到威胁名称，或者指定了文件名且路径匹配
                 should_include = False
                 if threat_info['threat_name'] != 'Unknown':
                     should_include = True
-                elif filename and threat_info['file_path'] != 'Unknown':
+                elif filename_re and threat_info['file_path'] != 'Unknown':
                     # 检查文件路径是否包含指定的文件名
-                    if filename.lower() in threat_info['file_path'].lower():
+                    if filename_re.search(threat_info['file_path']):
                         should_include = True
 
                 if should_include:
-                    # 构建原始威胁数据的JSON格式
-                    raw_threat_data = {
-                        '名称': threat_info['threat_name'],
-                        '严重性': threat_info['severity'],
-                        '路径': threat_info['file_path'],
-                        '进程名称': threat_info['process_name'],
-                        '操作': threat_info['action'],
-                        '检测时间': current_record.get('TimeCreated'),
-                        '事件ID': current_record.get('Id'),
-                        '完整消息': full_message
-                    }
-
+                    # 直接取原始时间字符串，时间解析统一在转换告警时进行
+                    # 中间记录只保留转换告警实际用到的字段（增量游标由原始事件的RecordId计算）
                     record = {
                         'ThreatName': threat_info['threat_name'],
-                        'DetectionTime': current_record.get('TimeCreated', datetime.now().isoformat()),
+                        'DetectionTime': time_created,
                         'FilePath': threat_info['file_path'],
                         'ProcessName': threat_info['process_name'],
-                        'Action': threat_info['action'],
-                        'Severity': threat_info['severity'],
-                        'EventId': current_record.get('Id', 'Unknown'),
-                        'RawData': raw_threat_data,  # 添加原始数据
-                        'source': 'Windows Event Log'
                     }
                     records.append(record)
                     logger.info(f"解析到威胁: {threat_info['threat_name']} -> {threat_info['file_path']}")
@@ -368,9 +454,31 @@ class WindowsDefenderEDRClient(EDRClient):
 
         except Exception as e:
             logger.error(f"解析事件日志输出失败: {str(e)}")
-            logger.error(f"原始输出: {output[:500]}...")
             return []
 
+    def _extract_threat_info_from_event_data(self, event_data: Dict[str, Any]) -> Dict[str, str]:
+        """从Windows Defender事件的结构化EventData字段中提取威胁信息，按字段名直接取值"""
+        threat_info = {
+            'threat_name': 'Unknown',
+            'file_path': 'Unknown',
+            'process_name': 'Unknown',
+            'action': 'Unknown',
+            'severity': 'Unknown'
+        }
+
+        for name, field in _EVENT_DATA_FIELDS.items():
+            value = event_data.get(name)
+            if not isinstance(value, str) or not value.strip():
+                continue
+            if field == 'file_path':
+                # 与消息解析一致：路径值必须以 file:_ 开头，多个资源时取第一个
+                if value[:6].lower() != 'file:_':
+                    continue
+                value = value[6:].split(';', 1)[0]
+            threat_info[field] = value.strip()
+
+        return threat_info
+
     def _extract_threat_info_from_message(self, message: str) -> Dict[str, str]:
         """从Windows Defender事件消息中提取威胁信息"""
         threat_info = {
@@ -382,74 +490,28 @@ class WindowsDefenderEDRClient(EDRClient):
         }
 
         try:
-            # 提取威胁名称 - 支持中英文，考虑前面可能有空格
-            # 中文格式: "        名称: TrojanDropper:Win32/Conficker.gen!A"
-            # 英文格式: "        Name: TrojanDropper:Win32/Conficker.gen!A"
-            name_patterns = [
-                r'\s*名称:\s*([^\r\n]+)',
-                r'\s*Name:\s*([^\r\n]+)',
-                r'\s*ThreatName:\s*([^\r\n]+)'
-            ]
+            # 单次扫描消息中的所有字段行，每个字段保留优先级最高（数值最小）的第一个匹配
+            priorities = {}
+            for match in _THREAT_FIELD_RE.finditer(message):
+                field, priority = _THREAT_FIELD_LABELS[match.group('label').lower()]
+                if field in priorities and priorities[field] <= priority:
+                    continue
 
-            for pattern in name_patterns:
-                match = re.search(pattern, message, re.IGNORECASE | re.MULTILINE)
-                if match:
-                    threat_info['threat_name'] = match.group(1).strip()
-                    break
+                value = match.group('value')
+                if field == 'file_path':
+                    # 路径字段的值必须以 file:_ 开头
+                    if value[:6].lower() != 'file:_':
+                        continue
+                    value = value[6:]
 
-            # 提取文件路径 - 考虑前面可能有空格
-            # 格式: "        路径: file:_C:\Users\vboxuser\Desktop\C9E0917FE3231A652C014AD76B55B26A.exe"
-            path_patterns = [
-                r'\s*路径:\s*file:_([^\r\n]+)',
-                r'\s*Path:\s*file:_([^\r\n]+)',
-                r'file:_([^\r\n;,\s]+)'
-            ]
+                threat_info[field] = value.strip()
+                priorities[field] = priority
 
-            for pattern in path_patterns:
-                match = re.search(pattern, message, re.IGNORECASE | re.MULTILINE)
+            # 回退模式本身不区分大小写且以 file:_ 开头，直接搜索原消息，不再为预检查复制一份小写消息
+            if 'file_path' not in priorities:
+                match = _FILE_PATH_FALLBACK_RE.search(message)
                 if match:
                     threat_info['file_path'] = match.group(1).strip()
-                    break
-
-            # 提取进程名称 - 考虑前面可能有空格
-            # 格式: "        进程名称: C:\Windows\System32\VBoxService.exe"
-            process_patterns = [
-                r'\s*进程名称:\s*([^\r\n]+)',
-                r'\s*Process Name:\s*([^\r\n]+)',
-                r'\s*ProcessName:\s*([^\r\n]+)'
-            ]
-
-            for pattern in process_patterns:
-                match = re.search(pattern, message, re.IGNORECASE | re.MULTILINE)
-                if match:
-                    threat_info['process_name'] = match.group(1).strip()
-                    break
-
-            # 提取操作 - 考虑前面可能有空格
-            # 格式: "        操作: 隔离"
-            action_patterns = [
-                r'\s*操作:\s*([^\r\n]+)',
-                r'\s*Action:\s*([^\r\n]+)'
-            ]
-
-            for pattern in action_patterns:
-                match = re.search(pattern, message, re.IGNORECASE | re.MULTILINE)
-                if match:
-                    threat_info['action'] = match.group(1).strip()
-                    break
-
-            # 提取严重性 - 考虑前面可能有空格
-            # 格式: "        严重性: 严重"
-            severity_patterns = [
-                r'\s*严重性:\s*([^\r\n]+)',
-                r'\s*Severity:\s*([^\r\n]+)'
-            ]
-
-            for pattern in severity_patterns:
-                match = re.search(pattern, message, re.IGNORECASE | re.MULTILINE)
-                if match:
-                    threat_info['severity'] = match.group(1).strip()
-                    break
 
         except Exception as e:
             logger.error(f"提取威胁信息失败: {str(e)}")
@@ -1,16 +1,29 @@
  
+import io
 import os
 import re
 import asyncio
+from contextlib import suppress
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
-import pytz
 from loguru import logger
 
 from app.models.task import EDRAlert
+from app.utils.helpers import generate_alert_id
 from .base import EDRClient
 
+DETECT_REASON_MAP = {
+    "专家分析": "Log",
+}
+SEVERITY_MAP = {
+    "高": "Critical",
+}
+
+# 检测记录行：某个以制表符分隔的单元格（去除空白后）恰好为"检测到"
+# 匹配成功后才拆分字段，不再为每一行构建去空白的单元格列表
+_DETECTED_CELL_RE = re.compile(r'(?:^|\t)\s*检测到\s*(?:\t|$)')
+
 
 class KasperskyEDRClient(EDRClient):
 
@@ -29,43 +42,41 @@ class KasperskyEDRClient(EDRClient):
             logger.info(f"执行导出Kaspersky报告: {export_report_cmd}")
             logger.info(f"导出路径: {report_path}")
 
-            # 使用优化的超时时间：报告导出操作
-            success_export, export_output = await self.vm_controller.execute_command_in_vm(
-                self.vm_name,
-                export_report_cmd,
-                self.username,
-                self.password,
-                timeout=self.timeouts.report_export_timeout,  # 从180秒优化为120秒
+            # 获取report.txt中的检测记录：在虚拟机端只保留含"检测到"的行，减少回传和解析的数据量
+            # 关键字用字符码拼出，避免中文经命令行传递时的编码问题
+            # 用.NET ReadLines直接流式读取，不经过Get-Content为每行构造PSObject和管道绑定；
+            # 编码与Get-Content一致：按BOM识别，无BOM时使用系统ANSI代码页
+            get_report_cmd = (
+                "$marker = -join [char[]](0x68C0, 0x6D4B, 0x5230); "
+                f"foreach ($line in [IO.File]::ReadLines('{report_path}', [Text.Encoding]::Default)) "
+                "{ if ($line.Contains($marker)) { $line } }"
             )
 
-            if not success_export:
-                logger.warning(f"Kaspersky报告导出失败: {export_output}")
-                return []
-
-
-            #获取report.txt文件内容命令
-            get_report_cmd = f"powershell.exe -Command Get-Content {report_path}"
-
-            # 使用优化的超时时间：文件读取操作
+            # 导出和读取合并为一次虚拟机内命令执行，减少一次guestcontrol往返和PowerShell启动；
+            # 导出失败时以avp.com的退出码结束，不再读取旧报告
             success, output = await self.vm_controller.execute_command_in_vm(
                 self.vm_name,
-                get_report_cmd,
+                f"{export_report_cmd}; if ($LASTEXITCODE -ne 0) {{ exit $LASTEXITCODE }}; {get_report_cmd}",
                 self.username,
                 self.password,
-                timeout=self.timeouts.file_read_timeout  # 从180秒优化为30秒
+                timeout=self.timeouts.report_export_timeout + self.timeouts.file_read_timeout,
             )
-            logger.info(f"powershell.exe -Command Get-Content: {success}")
-
-            if success and output.strip():
-                report_json = self.parse_kaspersky_log_to_json(
-                    output, start_time, end_time, file_hash, file_name
-                )
-              
-                return report_json
-            else:
-                logger.warning("avp.com命令执行失败或无输出")
+            logger.info(f"导出并读取Kaspersky报告: {success}")
+
+            if not success:
+                logger.warning(f"Kaspersky报告导出或读取失败: {output}")
+                return []
+            if not output.strip():
+                logger.info("Kaspersky报告中没有检测记录")
                 return []
 
+            # 报告较大时解析是纯CPU操作，放到线程中执行，不阻塞事件循环中其他虚拟机的命令
+            report_json = await asyncio.to_thread(
+                self.parse_kaspersky_log_to_json,
+                output, start_time, end_time, file_hash, file_name
+            )
+            return report_json
+
         except Exception as e:
             logger.error(f"获取报告信息失败: {str(e)}")
             return []
@@ -78,38 +89,37 @@ class KasperskyEDRClient(EDRClient):
         file_hash: Optional[str] = None,
         file_name: Optional[str] = None,
     ) -> List[EDRAlert]:
-        
-        DETECT_REASON_MAP = {
-            "专家分析": "Log",
-        }
-        SEVERITY_MAP = {
-            "高": "Critical",
-        }
-        
+        """解析Kaspersky报告为告警列表"""
         try:
             data = []
+            skipped = 0
             logger.info("解析Kaspersky日志数据")
-            lines = log_data.splitlines()
-            line_index = -1
-            for i, line in enumerate(lines):
-                parts = [p.strip() for p in line.split("\t") if p.strip()]  
-                if "检测到" in parts: 
-                    line_index = i
-                    try:
-                        time_field = parts[0]
-                        str_time = time_field.replace("今天，", "")  # 去掉 "今天，"
-                        # 如果你要解析为 datetime，取消注释下面这行（需要导入 datetime）
-                        # dt = datetime.strptime(s, "%Y/%m/%d %H:%M:%S")
-                    except Exception as e:
-                        # 如果解析失败，使用当前时间
-                        logger.warning(f"无法解析隔离时间: {time_field}")
-                        #dt = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"
-
-                    alert_hash = str(abs(hash(str(line)))) 
-                    reason_need_map = parts[19] if len(parts) > 19 else "None"
-                    severity_need_map = parts[10] if len(parts) > 10 else "None"
-                
+            # 整份报告中都没有检测记录时直接返回，不再切分行逐行检查
+            if "检测到" not in log_data:
+                logger.info("Kaspersky报告中没有检测记录")
+                return []
+            # 通过StringIO逐行迭代，不预先把整份报告切分成行列表；通常第一条检测记录后即结束
+            for line in io.StringIO(log_data):
+                # 先用预编译的正则判断是否为检测记录行，避免对每一行都拆分字段
+                if not _DETECTED_CELL_RE.search(line):
+                    continue
+                # 每个单元格只strip一次；空单元格仍需丢弃，下面的字段下标依赖该压缩后的顺序
+                parts = [cell for cell in map(str.strip, line.split("\t")) if cell]
+
+                str_time = parts[0].replace("今天，", "")  # 去掉 "今天，"
+                # 如果你要解析为 datetime，取消注释下面这行（需要导入 datetime）
+                # dt = datetime.strptime(s, "%Y/%m/%d %H:%M:%S")
+
+                # 稳定的告警ID：内置hash()受进程哈希随机化影响，跨进程不一致
+                alert_id = generate_alert_id(line)
+                reason_need_map = parts[19] if len(parts) > 19 else "None"
+                severity_need_map = parts[10] if len(parts) > 10 else "None"
+
+                # 字段缺失等格式异常只跳过该行并计数，循环结束后统一告警
+                alert = None
+                with suppress(IndexError, ValueError):
                     alert = EDRAlert(
+                        alert_id=alert_id,
                         severity=SEVERITY_MAP.get(severity_need_map, "None"),
                         alert_type=parts[8],
                         process_name=parts[14],
@@ -118,9 +128,14 @@ class KasperskyEDRClient(EDRClient):
                         file_path=parts[1],
                         source="Kaspersky"
                     )
-                    data.append(alert)
-                    break  # 只处理第一个匹配行
-    
+                if alert is None:
+                    skipped += 1
+                    continue
+                data.append(alert)
+                break  # 只处理第一个匹配行
+
+            if skipped:
+                logger.warning(f"跳过 {skipped} 条格式异常的Kaspersky检测记录")
             return data
         except Exception as e:
             logger.error(f"解析Kaspersky日志失败: {str(e)}")
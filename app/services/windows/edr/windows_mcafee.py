@@ -3,14 +3,44 @@ import re
 import asyncio
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
-import json
-import pytz
 from loguru import logger
 
 from app.models.task import EDRAlert
+from app.utils.helpers import json_loads
 from .base import EDRClient
 
 
+def _parse_detection_log(output: str) -> List[Dict[str, Any]]:
+    """
+    解析Detection.log内容
+
+    日志每条检测占一行(NDJSON)，逐行解析，单行格式异常只跳过该行；
+    整份内容是单个JSON对象/数组时(包括跨行格式化的情况)直接整体解析
+    """
+    try:
+        data = json_loads(output)
+    except ValueError:
+        results = []
+        skipped = 0
+        for line in output.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json_loads(line)
+            except ValueError:
+                skipped += 1
+                continue
+            if isinstance(record, dict):
+                results.append(record)
+        if skipped:
+            logger.warning(f"Mcafee检测日志中有 {skipped} 行无法解析，已跳过")
+        return results
+    if isinstance(data, dict):
+        return [data]
+    return [record for record in data if isinstance(record, dict)] if isinstance(data, list) else []
+
+
 class McafeeEDRClient(EDRClient):
 
 
@@ -26,10 +56,7 @@ class McafeeEDRClient(EDRClient):
             # 获取威胁检测信息（通过事件日志）
             threat_data = await self._get_threat_datas(file_name)
 
-            print("=== 威胁数据汇总 ===")
-            print(f"获取到 {len(threat_data)} 条威胁数据")
-            for i, data in enumerate(threat_data):
-                print(f"记录 {i+1}: {data}")
+            logger.debug("Mcafee威胁数据 {} 条: {}", len(threat_data), threat_data)
 
             # 转换为EDR告警
             if threat_data:
@@ -46,7 +73,7 @@ class McafeeEDRClient(EDRClient):
        
         try:
             log_path = (r"'C:\ProgramData\McAfee\wps\Detection.log'")
-            get_log_cmd = f"powershell -Command Get-Content {log_path}"
+            get_log_cmd = f"Get-Content {log_path}"
 
             # 使用优化的超时时间：从180秒优化为60秒
             success, output = await self.vm_controller.execute_command_in_vm(
@@ -58,10 +85,8 @@ class McafeeEDRClient(EDRClient):
             )
                         
             if success and output.strip():
-                data = json.loads(output)
-                results = []
-                results.append(data)
-                return results
+                # 日志较大时JSON解析会占用较长时间，放到线程中执行，不阻塞事件循环
+                return await asyncio.to_thread(_parse_detection_log, output)
             
             else:
                 logger.warning("McafeeParser命令执行失败或无输出")
@@ -77,25 +102,20 @@ class McafeeEDRClient(EDRClient):
         """
         将威胁数据转换为EDR告警
         """
-        alerts = []
-
-        for item in threat_data:
-            try:
-                alert = EDRAlert(
-                    severity='Critical',
-                    alert_type=item.get('detection_name'),
-                    process_name=item.get('initiator_name'),
-                    detect_reason='Log',
-                    detection_time=item.get('timestamp'),
-                    file_path=item.get("target_name"),
-                    source='McAfee',
-                )
-                alerts.append(alert)
-
-            except Exception as e:
-                logger.error(f"转换隔离区数据失败: {str(e)  }")
-                continue
-            
-        return alerts
+        return [alert for alert in map(self._build_alert, threat_data) if alert is not None]
 
-  
\ No newline at end of file
+    def _build_alert(self, item: Dict[str, Any]) -> Optional[EDRAlert]:
+        """将单条威胁数据转换为EDRAlert，转换失败时返回None，不影响其余记录"""
+        try:
+            return EDRAlert(
+                severity='Critical',
+                alert_type=item.get('detection_name'),
+                process_name=item.get('initiator_name'),
+                detect_reason='Log',
+                detection_time=item.get('timestamp'),
+                file_path=item.get("target_name"),
+                source='McAfee',
+            )
+        except Exception as e:
+            logger.error(f"转换隔离区数据失败: {str(e)}")
+            return None
@@ -6,14 +6,18 @@ import asyncio
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 
-import pytz
 from loguru import logger
 import xml.etree.ElementTree as ET
 from app.models.task import EDRAlert
+from app.utils.helpers import generate_alert_id, json_loads
 from .base import EDRClient
 
 
 class TrendMicroEDRClient(EDRClient):
+
+    # 同时读取解析的报告文件数上限
+    MAX_PARALLEL_REPORTS = 4
+
     async def get_alerts(
         self,
         start_time: datetime,
@@ -27,9 +31,12 @@ class TrendMicroEDRClient(EDRClient):
         data = []
         try:
             program_path = r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
+            # 由PowerShell直接筛选rca*.xml并输出JSON数组（@()保证单个文件时也是数组）
             arguments = [
+                "-NoProfile",
+                "-NonInteractive",
                 "-Command",
-                f"Get-ChildItem {report_path} -File -Filter '*.xml' | Select-Object -ExpandProperty Name",
+                f"ConvertTo-Json -Compress -InputObject @(Get-ChildItem {report_path} -File -Filter 'rca*.xml' | Select-Object -ExpandProperty Name)",
             ]
 
             success_get_path, output_path = (
@@ -50,75 +57,89 @@ class TrendMicroEDRClient(EDRClient):
             #     self.password,
             #     timeout=180,
             # )
+            if not success_get_path or not output_path.strip():
+                logger.warning(f"Trend Micro报告文件列表为空或获取失败: {output_path}")
+                return []
+            report_files = json_loads(output_path)
         except Exception as e:
             logger.error(f"获取Trend Micro报告文件列表失败: {str(e)}")
             return []
-        for line_filename in output_path.splitlines():
-            print(line_filename)  # 文件名
-            if line_filename.startswith("rca") and line_filename.endswith(".xml"):
-                report_path_temp = f"'C:\\ProgramData\\Trend Micro\\AMSP\\report\\10009\\{line_filename}'"
-                print(f"匹配到文件: {report_path_temp}")
-                get_report_cmd = (
-                    f"powershell.exe -Command Get-Content {report_path_temp}"
-                )
-                program_path = (
-                    r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
-                )
-                get_report_cmd = [
-                    "-Command",
-                    f"Get-Content {report_path_temp}",
-                ]
+        logger.debug("Trend Micro报告文件: {}", report_files)
+
+        # 并行读取解析各报告文件，限制并发数避免虚拟机CPU饱和
+        semaphore = asyncio.Semaphore(self.MAX_PARALLEL_REPORTS)
+
+        async def parse_with_semaphore(line_filename: str) -> Optional[EDRAlert]:
+            async with semaphore:
+                return await self._parse_report_file(line_filename)
+
+        for future in asyncio.as_completed([parse_with_semaphore(f) for f in report_files]):
+            alert = await future
+            if alert is not None:
+                data.append(alert)
+
+        # as_completed 按完成先后返回，顺序不固定；按检测时间和文件路径排序，保证结果稳定
+        data.sort(key=lambda alert: (alert.detection_time or "", alert.file_path or ""))
+        return data
+
+    async def _parse_report_file(self, line_filename: str) -> Optional[EDRAlert]:
+        """读取并解析单个Trend Micro RCA报告文件，失败时返回None"""
+        report_path_temp = f"'C:\\ProgramData\\Trend Micro\\AMSP\\report\\10009\\{line_filename}'"
+        logger.debug("匹配到文件: {}", report_path_temp)
+        program_path = (
+            r"C:\Windows\System32\WindowsPowerShell\v1.0\powershell.exe"
+        )
+        get_report_cmd = [
+            "-NoProfile",
+            "-NonInteractive",
+            "-Command",
+            f"Get-Content {report_path_temp}",
+        ]
+
+        success, output = await self.vm_controller.execute_program_in_vm(
+            self.vm_name,
+            program_path,
+            get_report_cmd,
+            self.username,
+            self.password,
+            timeout=self.timeouts.file_read_timeout,  # 使用配置的文件读取超时
+        )
+        if not (success and output.strip()):
+            logger.warning("Trend Micro命令执行失败或无输出")
+            return None
 
-                success, output = await self.vm_controller.execute_program_in_vm(
-                    self.vm_name,
-                    program_path,
-                    get_report_cmd,
-                    self.username,
-                    self.password,
-                    timeout=self.timeouts.file_read_timeout,  # 使用配置的文件读取超时
-                )
-                if success and output.strip():
-                    try:
-
-                        xml_json_result = self.parse_rca_xml(output)
-                        VirusName = xml_json_result["RcaReport"]["Trigger"]["Items"][
-                            "VirusName"
-                        ]
-                        FileName = xml_json_result["RcaReport"]["Trigger"]["Items"][
-                            "FileName"
-                        ]
-                        TriggerTime = xml_json_result["RcaReport"]["Summary"][
-                            "TriggerTime"
-                        ]
-                        dt = datetime.fromtimestamp(int(TriggerTime)).strftime(
-                            "%Y-%m-%dT%H:%M:%S"
-                        )  # 本地时间
-                        print(
-                            f"病毒名称: {VirusName}, 文件名称: {FileName}",
-                            f"触发时间: {dt}",
-                        )
-                        logger.info(f"xml 结果：{xml_json_result}")
-                        alert_hash = str(
-                            abs(hash(str(xml_json_result["RcaReport@attrib"])))
-                        )
-                        alert = EDRAlert(
-                            severity="Critical",
-                            alert_type=VirusName,
-                            detect_reason="Log",
-                            detection_time=dt,
-                            file_path=FileName,
-                            source="Trend",
-                        )
-                        data.append(alert)
-                        return data
-                    except Exception as e:
-                        logger.error(f"解析Trend Micro报告信息失败: {str(e)}")
-                        return []
-                else:
-                    logger.warning("Trend Micro命令执行失败或无输出")
-            else:
-                logger.warning(f"匹配文件失败: {line_filename}")
-        return []
+        try:
+
+            xml_json_result = self.parse_rca_xml(output)
+            VirusName = xml_json_result["RcaReport"]["Trigger"]["Items"][
+                "VirusName"
+            ]
+            FileName = xml_json_result["RcaReport"]["Trigger"]["Items"][
+                "FileName"
+            ]
+            TriggerTime = xml_json_result["RcaReport"]["Summary"][
+                "TriggerTime"
+            ]
+            dt = datetime.fromtimestamp(int(TriggerTime)).strftime(
+                "%Y-%m-%dT%H:%M:%S"
+            )  # 本地时间
+            # 使用loguru的延迟格式化，未开启debug级别时不会把整份报告格式化成字符串
+            logger.debug("病毒名称: {}, 文件名称: {}, 触发时间: {}", VirusName, FileName, dt)
+            logger.debug("xml 结果：{}", xml_json_result)
+            # 稳定的告警ID：只摘要标识检测的字段，不再把整个属性字典转成字符串后用内置hash()
+            alert_id = generate_alert_id(f"{FileName}|{TriggerTime}|{VirusName}")
+            return EDRAlert(
+                alert_id=alert_id,
+                severity="Critical",
+                alert_type=VirusName,
+                detect_reason="Log",
+                detection_time=dt,
+                file_path=FileName,
+                source="Trend",
+            )
+        except Exception as e:
+            logger.error(f"解析Trend Micro报告信息失败: {str(e)}")
+            return None
 
     def xml_to_dict(self, elem):
         """
@@ -162,10 +183,8 @@ class TrendMicroEDRClient(EDRClient):
                 # 如果 child_data 是 dict，取第一个 key
                 if isinstance(child_data, dict) and len(child_data) == 1:
                     key, value = next(iter(child_data.items()))
-                    # print(key, value)
                 else:
                     key, value = child.tag, child_data
-                    # print(key, value)
 
                 # Item 的情况已经直接展开，不需要 key = "Item"
                 if child.tag == "Item":
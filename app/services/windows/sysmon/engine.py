@@ -6,6 +6,7 @@ This service handles malware analysis using Sysmon-enabled virtual machines.
 import asyncio
 import json
 import os
+import re
 import tempfile
 from datetime import datetime
 from pathlib import Path
@@ -16,11 +17,23 @@ from app.core.config import get_settings
 from app.services.vm_controller import create_vm_controller
 from app.services.vm_pool_manager import get_vm_pool_manager
 from app.utils.helpers import utc_to_local_time, format_timestamp_to_local, get_current_local_time
+from app.utils.sysmon_message import parse_sysmon_fields
 from .manager import SysmonManager, SysmonConfigType, SysmonStatus
 
+# CamelCase -> snake_case conversion patterns, compiled once at import time
+_CAMEL_WORD_RE = re.compile(r'(.)([A-Z][a-z]+)')
+_CAMEL_BOUNDARY_RE = re.compile(r'([a-z0-9])([A-Z])')
+
 
 class SysmonAnalysisEngine:
     """Sysmon-based malware analysis engine"""
+
+    # Marker echoed by the guest once guest control accepts commands after boot
+    GUEST_READY_MARKER = "VMM_GUEST_READY"
+    # Guest readiness polling (seconds): exponential backoff up to the cap
+    GUEST_READY_TIMEOUT = 120
+    GUEST_READY_INITIAL_DELAY = 1.0
+    GUEST_READY_MAX_DELAY = 5.0
     
     def __init__(self):
         self.settings = get_settings()
@@ -119,7 +132,8 @@ class SysmonAnalysisEngine:
             raise Exception(f"Failed to start VM {vm_name}")
         
         # Wait for VM to be ready
-        await asyncio.sleep(30)
+        if not await self._wait_for_guest_ready(vm_name, vm_config):
+            logger.warning(f"VM {vm_name} did not answer within {self.GUEST_READY_TIMEOUT} seconds, continuing anyway")
         
         # Check if Sysmon is installed and running
         status, details = await self.sysmon_manager.get_sysmon_status(
@@ -181,6 +195,32 @@ class SysmonAnalysisEngine:
 
         logger.info(f"Sysmon VM {vm_name} is ready for analysis")
     
+    async def _wait_for_guest_ready(self, vm_name: str, vm_config: Any) -> bool:
+        """
+        Wait until the guest answers a marker command instead of sleeping a fixed time
+
+        Returns as soon as guest control can run commands, backing off between
+        attempts; returns False if the guest is still not ready at the timeout.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.GUEST_READY_TIMEOUT
+        delay = self.GUEST_READY_INITIAL_DELAY
+        marker_cmd = f"Write-Output '{self.GUEST_READY_MARKER}'"
+
+        while True:
+            success, output = await self.vm_controller.execute_command_in_vm(
+                vm_name, marker_cmd, vm_config.username, vm_config.password, timeout=15
+            )
+            if success and self.GUEST_READY_MARKER in output:
+                logger.info(f"VM {vm_name} guest is ready")
+                return True
+
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(delay, remaining))
+            delay = min(delay * 2, self.GUEST_READY_MAX_DELAY)
+
     async def _execute_and_monitor(
         self, 
         vm_name: str, 
@@ -269,7 +309,7 @@ class SysmonAnalysisEngine:
 
             # Analyze specific event types
             if event_id == 1:  # Process creation
-                self._analyze_process_creation(event, analysis)
+                self._analyze_process_creation(event, analysis, detailed_event)
             elif event_id == 3:  # Network connection
                 self._analyze_network_connection(event, analysis)
             elif event_id == 11:  # File create
@@ -279,20 +319,17 @@ class SysmonAnalysisEngine:
 
         return analysis
 
-    def _analyze_process_creation(self, event: Dict, analysis: Dict):
+    def _analyze_process_creation(self, event: Dict, analysis: Dict, detailed_event: Optional[Dict] = None):
         """Analyze process creation event"""
-        message = event.get("Message", "")
-        # Extract process information from message
-        # This is a simplified implementation
-        if "Image:" in message:
-            lines = message.split('\n')
-            for line in lines:
-                if line.startswith("Image:"):
-                    image = line.split(":", 1)[1].strip()
-                    if image not in analysis["processes"]:
-                        analysis["processes"][image] = 0
-                    analysis["processes"][image] += 1
-                    break
+        # Reuse the Image field already extracted for the detailed event instead of
+        # splitting the message into lines a second time
+        if detailed_event is not None:
+            image = detailed_event.get("image")
+        else:
+            image = self._parse_sysmon_message(event.get("Message", "")).get("Image")
+
+        if image:
+            analysis["processes"][image] = analysis["processes"].get(image, 0) + 1
 
     def _analyze_network_connection(self, event: Dict, analysis: Dict):
         """Analyze network connection event"""
@@ -518,25 +555,16 @@ class SysmonAnalysisEngine:
 
     def _convert_to_snake_case(self, camel_str: str) -> str:
         """将CamelCase转换为snake_case"""
-        import re
         # 在大写字母前插入下划线，然后转换为小写
-        snake_str = re.sub('(.)([A-Z][a-z]+)', r'\1_\2', camel_str)
-        return re.sub('([a-z0-9])([A-Z])', r'\1_\2', snake_str).lower()
+        snake_str = _CAMEL_WORD_RE.sub(r'\1_\2', camel_str)
+        return _CAMEL_BOUNDARY_RE.sub(r'\1_\2', snake_str).lower()
 
     def _parse_sysmon_message(self, message: str) -> Dict[str, str]:
         """解析Sysmon消息中的键值对"""
         parsed = {}
         try:
-            lines = message.split('\n')
-            for line in lines:
-                line = line.strip()
-                if ':' in line and not line.startswith('RuleName'):
-                    # 分割键值对
-                    parts = line.split(':', 1)
-                    if len(parts) == 2:
-                        key = parts[0].strip()
-                        value = parts[1].strip()
-                        parsed[key] = value
+            # 单次扫描整条消息，直接取出每行的键值对，不再逐行切分字符串
+            parsed = parse_sysmon_fields(message)
         except Exception as e:
             logger.warning(f"Error parsing Sysmon message: {str(e)}")
 
@@ -4,9 +4,12 @@ This module provides functionality to install, configure, and manage Sysmon on v
 """
 
 import asyncio
+import io
+import json
 import os
 import subprocess
 import tempfile
+import time
 import zipfile
 from pathlib import Path
 from typing import Dict, Optional, Tuple, List
@@ -33,14 +36,23 @@ class SysmonStatus(str, Enum):
 
 class SysmonManager:
     """Manages Sysmon installation and configuration on VMs"""
+
+    # How long a downloaded Sysmon package is reused before fetching it again
+    DOWNLOAD_CACHE_TTL = 6 * 3600
+    # Polling used to verify the service after installation (seconds)
+    INSTALL_VERIFY_TIMEOUT = 5
+    INSTALL_VERIFY_INTERVAL = 0.5
     
     def __init__(self, vm_controller):
         self.vm_controller = vm_controller
         self.sysmon_url = "https://download.sysinternals.com/files/Sysmon.zip"
-        # Update paths to point to the tools directory
-        self.tools_dir = Path(__file__).parent.parent.parent.parent.parent / "tools" / "sysmon"
-        self.configs_dir = self.tools_dir / "configs"
-        self.scripts_dir = self.tools_dir / "scripts"
+        # (monotonic download time, local Sysmon executable path)
+        self._sysmon_download: Optional[Tuple[float, str]] = None
+        # Use the configs and scripts shipped inside this package (package_data),
+        # not the duplicate copies under the repository's tools/ directory
+        package_dir = Path(__file__).parent
+        self.configs_dir = package_dir / "configs"
+        self.scripts_dir = package_dir / "scripts"
 
         # Configuration file mappings
         self.config_files = {
@@ -91,20 +103,21 @@ class SysmonManager:
             if not config_path:
                 return False, "Configuration file not found"
             
-            # Copy Sysmon to VM
+            # Copy Sysmon and its configuration to VM; the two transfers are
+            # independent, so run them concurrently
             vm_sysmon_path = "C:\\Windows\\Temp\\Sysmon64.exe"
-            success = await self.vm_controller.copy_file_to_vm(
-                vm_name, sysmon_path, vm_sysmon_path, username, password
-            )
-            if not success:
-                return False, "Failed to copy Sysmon to VM"
-            
-            # Copy configuration to VM
             vm_config_path = "C:\\Windows\\Temp\\sysmon-config.xml"
-            success = await self.vm_controller.copy_file_to_vm(
-                vm_name, str(config_path), vm_config_path, username, password
+            sysmon_copied, config_copied = await asyncio.gather(
+                self.vm_controller.copy_file_to_vm(
+                    vm_name, sysmon_path, vm_sysmon_path, username, password
+                ),
+                self.vm_controller.copy_file_to_vm(
+                    vm_name, str(config_path), vm_config_path, username, password
+                ),
             )
-            if not success:
+            if not sysmon_copied:
+                return False, "Failed to copy Sysmon to VM"
+            if not config_copied:
                 return False, "Failed to copy Sysmon configuration to VM"
             
             # Uninstall existing Sysmon if force reinstall
@@ -121,9 +134,15 @@ class SysmonManager:
             if success:
                 logger.info(f"Sysmon installed successfully on {vm_name}")
                 
-                # Verify installation
-                await asyncio.sleep(5)
-                status, details = await self.get_sysmon_status(vm_name, username, password)
+                # Verify installation: the service is normally registered by the time the
+                # installer returns, so poll the status instead of always waiting 5 seconds
+                deadline = time.monotonic() + self.INSTALL_VERIFY_TIMEOUT
+                while True:
+                    status, details = await self.get_sysmon_status(vm_name, username, password)
+                    if status in [SysmonStatus.INSTALLED, SysmonStatus.RUNNING] or time.monotonic() >= deadline:
+                        break
+                    await asyncio.sleep(self.INSTALL_VERIFY_INTERVAL)
+
                 if status in [SysmonStatus.INSTALLED, SysmonStatus.RUNNING]:
                     return True, f"Sysmon installed and running (Status: {status})"
                 else:
@@ -152,46 +171,56 @@ class SysmonManager:
             # Check for multiple possible Sysmon service names
             service_names = ["Sysmon64", "Sysmon", "SysmonDrv"]
 
-            for service_name in service_names:
-                service_cmd = f'Get-Service -Name "{service_name}" -ErrorAction SilentlyContinue | Select-Object Name, Status | ConvertTo-Json'
-                success, output = await self.vm_controller.execute_command_in_vm(
-                    vm_name, service_cmd, username, password, timeout=30
-                )
-
-                if success and output.strip() and output.strip() != "null":
-                    # Parse service status
-                    import json
-                    try:
-                        service_info = json.loads(output)
-                        # Ensure status is converted to string before calling lower()
-                        raw_status = service_info.get("Status", "")
-                        service_status = str(raw_status).lower() if raw_status else ""
-                        service_found_name = service_info.get("Name", service_name)
-
-                        if service_status == "running":
-                            return SysmonStatus.RUNNING, f"Sysmon service '{service_found_name}' is running"
-                        elif service_status == "stopped":
-                            return SysmonStatus.STOPPED, f"Sysmon service '{service_found_name}' is stopped"
-                        else:
-                            return SysmonStatus.INSTALLED, f"Sysmon service '{service_found_name}' status: {service_status}"
-
-                    except json.JSONDecodeError:
-                        # If JSON parsing fails, try alternative method
-                        if "running" in output.lower():
-                            return SysmonStatus.RUNNING, f"Sysmon service '{service_name}' is running"
-                        elif "stopped" in output.lower():
-                            return SysmonStatus.STOPPED, f"Sysmon service '{service_name}' is stopped"
-                        else:
-                            return SysmonStatus.INSTALLED, f"Sysmon service '{service_name}' exists but status unclear"
-
-            # If no service found, check if Sysmon executable exists
-            logger.info("No Sysmon service found, checking for Sysmon executable...")
-            exe_check_cmd = 'Get-ChildItem -Path "C:\\Windows\\Sysmon*.exe" -ErrorAction SilentlyContinue | Select-Object Name'
+            # Query all service names and the executable fallback in a single
+            # PowerShell session instead of one guest process per probe
+            names_arg = ", ".join(f'"{name}"' for name in service_names)
+            status_cmd = (
+                f"$services = @(Get-Service -Name {names_arg} -ErrorAction SilentlyContinue | "
+                "Select-Object Name, @{n='Status';e={[string]$_.Status}}); "
+                "$exeCount = @(Get-ChildItem -Path 'C:\\Windows\\Sysmon*.exe' -ErrorAction SilentlyContinue).Count; "
+                "ConvertTo-Json -Compress -Depth 3 -InputObject @{services = $services; exe_count = $exeCount}"
+            )
             success, output = await self.vm_controller.execute_command_in_vm(
-                vm_name, exe_check_cmd, username, password, timeout=30
+                vm_name, status_cmd, username, password, timeout=30
             )
+            if not success:
+                raise RuntimeError(f"Sysmon status query failed: {output}")
+
+            try:
+                status_info = json.loads(output)
+            except json.JSONDecodeError:
+                # If JSON parsing fails, try alternative method
+                output_lower = output.lower()
+                if "running" in output_lower:
+                    return SysmonStatus.RUNNING, "Sysmon service is running"
+                elif "stopped" in output_lower:
+                    return SysmonStatus.STOPPED, "Sysmon service is stopped"
+                elif "sysmon" in output_lower:
+                    return SysmonStatus.INSTALLED, "Sysmon found but status unclear"
+                return SysmonStatus.NOT_INSTALLED, "Sysmon service and executable not found"
+
+            services = {
+                str(service.get("Name", "")).lower(): service
+                for service in status_info.get("services") or []
+            }
+            for service_name in service_names:
+                service_info = services.get(service_name.lower())
+                if service_info is None:
+                    continue
+
+                # Ensure status is converted to string before calling lower()
+                raw_status = service_info.get("Status", "")
+                service_status = str(raw_status).lower() if raw_status else ""
+                service_found_name = service_info.get("Name", service_name)
+
+                if service_status == "running":
+                    return SysmonStatus.RUNNING, f"Sysmon service '{service_found_name}' is running"
+                elif service_status == "stopped":
+                    return SysmonStatus.STOPPED, f"Sysmon service '{service_found_name}' is stopped"
+                else:
+                    return SysmonStatus.INSTALLED, f"Sysmon service '{service_found_name}' status: {service_status}"
 
-            if success and output.strip() and "sysmon" in output.lower():
+            if status_info.get("exe_count"):
                 logger.info("Sysmon executable found but service not running")
                 return SysmonStatus.INSTALLED, "Sysmon executable found but service not running"
 
@@ -249,8 +278,15 @@ class SysmonManager:
         try:
             logger.info(f"Retrieving Sysmon events from VM: {vm_name}")
             
-            # Get Sysmon events from Windows Event Log
-            events_cmd = f'Get-WinEvent -LogName "Microsoft-Windows-Sysmon/Operational" -MaxEvents {max_events} -ErrorAction SilentlyContinue | Select-Object TimeCreated, Id, LevelDisplayName, Message | ConvertTo-Json'
+            # Get Sysmon events from Windows Event Log as compact JSON. TimeCreated is
+            # rendered as an ISO-8601 UTC string instead of PowerShell's nested DateTime
+            # object, and -Compress drops the indentation that otherwise inflates the
+            # guest output for large event batches
+            events_cmd = (
+                f'Get-WinEvent -LogName "Microsoft-Windows-Sysmon/Operational" -MaxEvents {max_events} -ErrorAction SilentlyContinue | '
+                "Select-Object @{n='TimeCreated';e={$_.TimeCreated.ToUniversalTime().ToString('o')}}, Id, LevelDisplayName, Message | "
+                'ConvertTo-Json -Compress'
+            )
             
             success, output = await self.vm_controller.execute_command_in_vm(
                 vm_name, events_cmd, username, password, timeout=120
@@ -263,7 +299,6 @@ class SysmonManager:
                 return True, []  # No events found
             
             # Parse events
-            import json
             try:
                 events = json.loads(output)
                 if not isinstance(events, list):
@@ -318,38 +353,45 @@ class SysmonManager:
         Returns:
             Path to Sysmon64.exe or None if failed
         """
+        # Reuse a recent download instead of fetching the package for every install
+        if self._sysmon_download:
+            downloaded_at, cached_path = self._sysmon_download
+            if time.monotonic() - downloaded_at < self.DOWNLOAD_CACHE_TTL and os.path.exists(cached_path):
+                logger.info(f"Using cached Sysmon download: {cached_path}")
+                return cached_path
+            self._sysmon_download = None
+
         try:
             logger.info("Downloading Sysmon from Microsoft Sysinternals")
 
             # Create temporary directory
             temp_dir = tempfile.mkdtemp(prefix="sysmon_")
-            zip_path = os.path.join(temp_dir, "Sysmon.zip")
             extract_path = os.path.join(temp_dir, "sysmon")
 
             # Download Sysmon zip file
             response = requests.get(self.sysmon_url, timeout=300)
             response.raise_for_status()
 
-            with open(zip_path, 'wb') as f:
-                f.write(response.content)
-
-            logger.info(f"Sysmon downloaded to: {zip_path}")
+            logger.info(f"Sysmon downloaded ({len(response.content)} bytes)")
 
-            # Extract zip file
+            # Extract straight from the downloaded bytes instead of writing the
+            # archive to disk and reopening it
             os.makedirs(extract_path, exist_ok=True)
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+            with zipfile.ZipFile(io.BytesIO(response.content), 'r') as zip_ref:
                 zip_ref.extractall(extract_path)
 
             # Find Sysmon64.exe
             sysmon64_path = os.path.join(extract_path, "Sysmon64.exe")
             if os.path.exists(sysmon64_path):
                 logger.info(f"Sysmon64.exe found at: {sysmon64_path}")
+                self._sysmon_download = (time.monotonic(), sysmon64_path)
                 return sysmon64_path
             else:
                 # Fallback to Sysmon.exe
                 sysmon_path = os.path.join(extract_path, "Sysmon.exe")
                 if os.path.exists(sysmon_path):
                     logger.info(f"Sysmon.exe found at: {sysmon_path}")
+                    self._sysmon_download = (time.monotonic(), sysmon_path)
                     return sysmon_path
                 else:
                     logger.error("No Sysmon executable found in downloaded package")
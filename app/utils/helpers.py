@@ -2,12 +2,100 @@
 工具函数模块
 """
 import os
+import re
+import json
 import hashlib
 import mimetypes
+from functools import lru_cache
 from typing import Optional, Dict, Any, Union
 from datetime import datetime, timedelta, timezone
 import pytz
 
+# orjson为可选依赖，未安装时回退到标准库json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+# PowerShell ConvertTo-Json 输出的 /Date(毫秒时间戳)/ 格式
+_DOTNET_DATE_RE = re.compile(r'/Date\((\d+)\)/')
+
+# 默认本地时区（中国时区）及输出格式，模块加载时只创建一次
+_DEFAULT_TZ = pytz.timezone('Asia/Shanghai')
+_LOCAL_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+# strptime 回退时尝试的时间格式
+_UTC_TIME_FORMATS = (
+    "%Y-%m-%dT%H:%M:%S.%fZ",      # 2025-10-01T12:00:00.123456Z
+    "%Y-%m-%dT%H:%M:%SZ",         # 2025-10-01T12:00:00Z
+    "%Y-%m-%dT%H:%M:%S.%f",       # 2025-10-01T12:00:00.123456
+    "%Y-%m-%dT%H:%M:%S",          # 2025-10-01T12:00:00
+    "%Y-%m-%d %H:%M:%S.%f",       # 2025-10-01 12:00:00.123456
+    "%Y-%m-%d %H:%M:%S",          # 2025-10-01 12:00:00
+    "%Y/%m/%d %H:%M:%S",          # 2025/10/01 12:00:00
+    "%d/%m/%Y %H:%M:%S",          # 01/10/2025 12:00:00
+)
+
+
+def _parse_utc_fast(time_str: str) -> Optional[datetime]:
+    """
+    按固定位置切片解析 YYYY-MM-DD HH:MM:SS[.ffffff][Z] 格式的时间
+
+    日期分隔符可为 - 或 /，日期与时间之间可为 T 或空格。格式不符时返回None，
+    由调用方回退到 strptime。
+
+    Args:
+        time_str: 已去除首尾空白的时间字符串
+
+    Returns:
+        Optional[datetime]: 不带时区的datetime
+    """
+    if (len(time_str) < 19 or time_str[4] not in '-/' or time_str[7] != time_str[4]
+            or time_str[10] not in 'T ' or time_str[13] != ':' or time_str[16] != ':'):
+        return None
+
+    rest = time_str[19:]
+    if rest.endswith('Z'):
+        rest = rest[:-1]
+    microsecond = 0
+    if rest:
+        fraction = rest[1:]
+        if rest[0] != '.' or not fraction.isdigit():
+            return None
+        # PowerShell 输出7位小数，datetime 只支持到微秒
+        microsecond = int(fraction[:6].ljust(6, '0'))
+
+    try:
+        return datetime(
+            int(time_str[0:4]), int(time_str[5:7]), int(time_str[8:10]),
+            int(time_str[11:13]), int(time_str[14:16]), int(time_str[17:19]),
+            microsecond
+        )
+    except ValueError:
+        return None
+
+
+@lru_cache(maxsize=32)
+def _get_timezone(local_timezone: Optional[str] = None):
+    """
+    获取时区对象并缓存，未指定或无效时使用默认中国时区
+
+    Args:
+        local_timezone: 时区名称
+
+    Returns:
+        时区对象
+    """
+    if not local_timezone:
+        return _DEFAULT_TZ
+    try:
+        return pytz.timezone(local_timezone)
+    except pytz.exceptions.UnknownTimeZoneError:
+        return _DEFAULT_TZ
+
 
 def calculate_file_hash(file_path: str, algorithm: str = "sha256") -> str:
     """
@@ -23,12 +111,46 @@ def calculate_file_hash(file_path: str, algorithm: str = "sha256") -> str:
     hash_func = getattr(hashlib, algorithm)()
     
     with open(file_path, 'rb') as f:
-        while chunk := f.read(8192):
+        while chunk := f.read(1024 * 1024):
             hash_func.update(chunk)
     
     return hash_func.hexdigest()
 
 
+def json_loads(data: Union[str, bytes]) -> Any:
+    """
+    解析JSON文本
+
+    安装了orjson时使用orjson，否则使用标准库json，两者的解析错误都是ValueError的子类
+
+    Args:
+        data: JSON文本
+
+    Returns:
+        Any: 解析结果
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def generate_alert_id(content: Union[str, bytes]) -> str:
+    """
+    生成稳定的告警ID
+
+    使用BLAKE2b摘要，跨进程结果一致（内置hash()受哈希随机化影响），可用于告警去重
+
+    Args:
+        content: 用于标识告警的原始内容
+
+    Returns:
+        str: 16位十六进制告警ID
+    """
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.blake2b(content, digest_size=8).hexdigest()
+
+
 def get_file_type(file_path: str) -> str:
     """
     获取文件类型
@@ -278,37 +400,27 @@ def utc_to_local_time(utc_time_str: str, local_timezone: str = None) -> str:
         return ""
 
     try:
+        time_str = utc_time_str.strip()
+
         # 首先检查是否是 /Date(timestamp)/ 格式
-        import re
-        date_match = re.match(r'/Date\((\d+)\)/', utc_time_str.strip())
+        date_match = _DOTNET_DATE_RE.match(time_str)
         if date_match:
             # 提取时间戳（毫秒）
             timestamp_ms = int(date_match.group(1))
             # 转换为秒
             timestamp_s = timestamp_ms / 1000.0
             # 创建UTC datetime对象
-            utc_dt = datetime.fromtimestamp(timestamp_s, tz=pytz.UTC)
+            utc_dt = datetime.fromtimestamp(timestamp_s, tz=timezone.utc)
         else:
-            # 支持的时间格式列表
-            time_formats = [
-                "%Y-%m-%dT%H:%M:%S.%fZ",      # 2025-10-01T12:00:00.123456Z
-                "%Y-%m-%dT%H:%M:%SZ",         # 2025-10-01T12:00:00Z
-                "%Y-%m-%dT%H:%M:%S.%f",       # 2025-10-01T12:00:00.123456
-                "%Y-%m-%dT%H:%M:%S",          # 2025-10-01T12:00:00
-                "%Y-%m-%d %H:%M:%S.%f",       # 2025-10-01 12:00:00.123456
-                "%Y-%m-%d %H:%M:%S",          # 2025-10-01 12:00:00
-                "%Y/%m/%d %H:%M:%S",          # 2025/10/01 12:00:00
-                "%d/%m/%Y %H:%M:%S",          # 01/10/2025 12:00:00
-            ]
-
-            # 尝试解析UTC时间
-            utc_dt = None
-            for fmt in time_formats:
-                try:
-                    utc_dt = datetime.strptime(utc_time_str.strip(), fmt)
-                    break
-                except ValueError:
-                    continue
+            # 常见的固定宽度格式直接切片解析，其余格式再逐个尝试strptime
+            utc_dt = _parse_utc_fast(time_str)
+            if utc_dt is None:
+                for fmt in _UTC_TIME_FORMATS:
+                    try:
+                        utc_dt = datetime.strptime(time_str, fmt)
+                        break
+                    except ValueError:
+                        continue
 
             if utc_dt is None:
                 # 如果所有格式都失败，返回原始字符串
@@ -316,24 +428,13 @@ def utc_to_local_time(utc_time_str: str, local_timezone: str = None) -> str:
 
             # 设置为UTC时区（仅对非/Date格式需要）
             if utc_dt.tzinfo is None:
-                utc_dt = utc_dt.replace(tzinfo=pytz.UTC)
-
-        # 确定目标时区
-        if local_timezone:
-            try:
-                target_tz = pytz.timezone(local_timezone)
-            except pytz.exceptions.UnknownTimeZoneError:
-                # 如果时区无效，使用系统本地时区
-                target_tz = pytz.timezone('Asia/Shanghai')  # 默认使用中国时区
-        else:
-            # 使用系统本地时区（中国时区）
-            target_tz = pytz.timezone('Asia/Shanghai')
+                utc_dt = utc_dt.replace(tzinfo=timezone.utc)
 
-        # 转换到本地时区
-        local_dt = utc_dt.astimezone(target_tz)
+        # 转换到本地时区（无效或未指定时使用中国时区）
+        local_dt = utc_dt.astimezone(_get_timezone(local_timezone))
 
         # 返回格式化的本地时间
-        return local_dt.strftime("%Y-%m-%d %H:%M:%S")
+        return local_dt.strftime(_LOCAL_TIME_FORMAT)
 
     except Exception:
         # 如果转换失败，返回原始字符串
@@ -358,13 +459,12 @@ def format_timestamp_to_local(timestamp: Union[str, datetime], local_timezone: s
         if isinstance(timestamp, str):
             return utc_to_local_time(timestamp, local_timezone)
         elif isinstance(timestamp, datetime):
-            # 如果是datetime对象，先转换为ISO格式字符串
+            # datetime对象直接转换时区，不再先格式化成ISO字符串再解析回来
             if timestamp.tzinfo is None:
                 # 假设是UTC时间
-                timestamp_str = timestamp.isoformat() + "Z"
-            else:
-                timestamp_str = timestamp.isoformat()
-            return utc_to_local_time(timestamp_str, local_timezone)
+                timestamp = timestamp.replace(tzinfo=timezone.utc)
+            local_dt = timestamp.astimezone(_get_timezone(local_timezone))
+            return local_dt.strftime(_LOCAL_TIME_FORMAT)
         else:
             return str(timestamp)
     except Exception:
@@ -382,15 +482,7 @@ def get_current_local_time(local_timezone: str = None) -> str:
         str: 当前本地时间字符串
     """
     try:
-        if local_timezone:
-            try:
-                target_tz = pytz.timezone(local_timezone)
-            except pytz.exceptions.UnknownTimeZoneError:
-                target_tz = pytz.timezone('Asia/Shanghai')
-        else:
-            target_tz = pytz.timezone('Asia/Shanghai')
-
-        local_dt = datetime.now(target_tz)
-        return local_dt.strftime("%Y-%m-%d %H:%M:%S")
+        local_dt = datetime.now(_get_timezone(local_timezone))
+        return local_dt.strftime(_LOCAL_TIME_FORMAT)
     except Exception:
-        return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        return datetime.now().strftime(_LOCAL_TIME_FORMAT)
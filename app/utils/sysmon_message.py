@@ -0,0 +1,28 @@
+"""
+Sysmon event message parsing
+
+Kept free of third-party imports so the parser can be used (and tested) on its own.
+"""
+import re
+from typing import Dict
+
+# "Key: Value" lines of a Sysmon message (RuleName lines are skipped). The lookahead
+# covers the indentation too, otherwise backtracking into [ \t]* would let an indented
+# RuleName line through with the whitespace captured as part of the key
+SYSMON_FIELD_RE = re.compile(
+    r'^(?![ \t]*RuleName)[ \t]*([^:\r\n]*?)[ \t]*:[ \t]*([^\r\n]*?)[ \t\r]*$',
+    re.MULTILINE
+)
+
+
+def parse_sysmon_fields(message: str) -> Dict[str, str]:
+    """
+    Parse the "Key: Value" lines of a Sysmon event message in a single pass
+
+    Args:
+        message: Rendered Sysmon event message
+
+    Returns:
+        Dict[str, str]: Field name -> value, both with surrounding whitespace removed
+    """
+    return {match.group(1): match.group(2) for match in SYSMON_FIELD_RE.finditer(message)}
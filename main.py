@@ -96,9 +96,11 @@ def create_app() -> FastAPI:
 
     # Add custom middleware
     app.add_middleware(LoggingMiddleware)
+    # /api/samples/ is fetched from inside analysis VMs, which never get the API key;
+    # the route checks its own single-use sample download token instead
     app.add_middleware(
         APIKeyMiddleware,
-        exclude_paths=["/docs", "/redoc", "/openapi.json", "/api/health"]
+        exclude_paths=["/docs", "/redoc", "/openapi.json", "/api/health", "/api/samples/"]
     )
 
     # Register routes
@@ -72,6 +72,10 @@ setup(
             "bandit>=1.7",
             "safety>=2.0",
         ],
+        "perf": [
+            "orjson>=3.9",
+            "google-re2>=1.1",
+        ],
     },
     entry_points={
         "console_scripts": [
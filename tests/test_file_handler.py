@@ -0,0 +1,57 @@
+"""
+上传文件保存测试：边写边算哈希，按哈希命名，且文件权限与直接创建文件时一致
+"""
+import asyncio
+import hashlib
+import os
+import stat
+
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("loguru")
+
+from app.core.config import get_settings
+from app.services.file_handler import DEFAULT_FILE_MODE, FileHandler
+
+
+class _FakeUpload:
+    """只实现 save_uploaded_file 用到的 filename 和分块 read"""
+
+    def __init__(self, filename, content):
+        self.filename = filename
+        self._content = content
+        self._offset = 0
+
+    async def read(self, size=-1):
+        end = len(self._content) if size < 0 else self._offset + size
+        chunk = self._content[self._offset:end]
+        self._offset += len(chunk)
+        return chunk
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings().server, "upload_dir", str(tmp_path))
+    return FileHandler()
+
+
+def test_save_uploaded_file_names_file_by_hash(handler, tmp_path):
+    content = b"MZ" + os.urandom(3 * 1024 * 1024)
+
+    info = asyncio.run(handler.save_uploaded_file(_FakeUpload("sample.exe", content)))
+
+    file_hash = hashlib.sha256(content).hexdigest()
+    assert info["hash"] == file_hash
+    assert info["size"] == len(content)
+    assert info["path"] == os.path.join(str(tmp_path), f"{file_hash}.exe")
+    with open(info["path"], "rb") as f:
+        assert f.read() == content
+    # 临时文件已被重命名，不残留 .part 文件
+    assert os.listdir(tmp_path) == [f"{file_hash}.exe"]
+
+
+def test_saved_file_uses_default_umask_mode(handler):
+    info = asyncio.run(handler.save_uploaded_file(_FakeUpload("sample.bin", b"payload")))
+
+    assert stat.S_IMODE(os.stat(info["path"]).st_mode) == DEFAULT_FILE_MODE
@@ -0,0 +1,52 @@
+"""
+样本下载接口测试：虚拟机内只持有一次性下载令牌，不带API密钥也必须能通过完整的应用栈下载样本
+"""
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+
+from fastapi.testclient import TestClient
+
+from app.core.config import get_settings
+from app.core.security import issue_sample_download_token
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.setattr(get_settings().server, "upload_dir", str(tmp_path))
+    from main import app
+    # 不进入上下文管理器，不触发lifespan中的任务管理器启动
+    return TestClient(app)
+
+
+def test_download_sample_with_token_and_no_api_key(client, tmp_path):
+    (tmp_path / "abc123.exe").write_bytes(b"MZ sample")
+    token = issue_sample_download_token("abc123.exe", 30)
+
+    response = client.get("/api/samples/abc123.exe", headers={"X-Sample-Token": token})
+
+    assert response.status_code == 200
+    assert response.content == b"MZ sample"
+
+
+def test_download_sample_token_is_single_use(client, tmp_path):
+    (tmp_path / "abc123.exe").write_bytes(b"MZ sample")
+    token = issue_sample_download_token("abc123.exe", 30)
+    headers = {"X-Sample-Token": token}
+
+    assert client.get("/api/samples/abc123.exe", headers=headers).status_code == 200
+    assert client.get("/api/samples/abc123.exe", headers=headers).status_code == 401
+
+
+def test_download_sample_token_is_bound_to_file(client, tmp_path):
+    (tmp_path / "other.exe").write_bytes(b"MZ other")
+    token = issue_sample_download_token("abc123.exe", 30)
+
+    response = client.get("/api/samples/other.exe", headers={"X-Sample-Token": token})
+
+    assert response.status_code == 401
+
+
+def test_other_routes_still_require_api_key(client):
+    assert client.get("/api/tasks").status_code == 401
@@ -0,0 +1,33 @@
+"""
+Sysmon消息键值对解析测试
+"""
+import pytest
+
+from app.utils.sysmon_message import parse_sysmon_fields
+
+
+def _parse_lines(message):
+    """逐行解析的参考实现（与单次正则扫描的结果应完全一致）"""
+    parsed = {}
+    for line in message.split('\n'):
+        line = line.strip()
+        if ':' in line and not line.startswith('RuleName'):
+            key, value = line.split(':', 1)
+            parsed[key.strip()] = value.strip()
+    return parsed
+
+
+@pytest.mark.parametrize("message", [
+    "RuleName: -\nUtcTime: 2025-01-01 00:00:00.000\nImage: C:\\Windows\\System32\\cmd.exe",
+    "  RuleName: x\n  ProcessId: 1234\n  CommandLine: cmd.exe /c echo a:b",
+    "\tRuleName: -\r\n\tImage: C:\\a.exe\r\n\tUser: NT AUTHORITY\\SYSTEM\r\n",
+    "Process Create:\nRuleName: technique_id=T1059\nHashes: SHA256=ABC,MD5=DEF\n",
+    "no colon here\n   \nKey:\n  Key2 :  value with spaces  \n",
+])
+def test_parse_matches_line_by_line(message):
+    assert parse_sysmon_fields(message) == _parse_lines(message)
+
+
+def test_indented_rule_name_lines_are_skipped():
+    parsed = parse_sysmon_fields("  RuleName: x\n\tRuleName: -\n  Image: C:\\a.exe")
+    assert parsed == {"Image": "C:\\a.exe"}